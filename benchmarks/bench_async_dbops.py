@@ -0,0 +1,89 @@
+"""
+Benchmark of DBOps against AsyncDBOps for batches of patient lookups.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_async_dbops --db inmemory --calls 200 --concurrency 16
+
+Every call resolves a patient and its model list. The sync version performs the
+calls one after another, the async version keeps up to --concurrency in flight.
+The gain comes from overlapping network round trips: against the in-process
+'local' backend there is nothing to overlap and the run only measures the
+thread pool overhead.
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+from main.async_database_ops import AsyncDBOps
+
+PATIENTS = [
+    (850, "SER00002"),
+    (740, ["SER00008", "SER00009"]),
+    (663, "SER00302"),
+]
+
+
+def run_sync(dbops, calls: list) -> float:
+    """
+    Function to run the lookups sequentially, returning the elapsed seconds.
+    """
+    start = time.perf_counter()
+    for internal_id, series in calls:
+        dbops.get_patient_collection(internal_id, series)
+        dbops.get_patient_model_list(internal_id, series)
+    return time.perf_counter() - start
+
+
+async def run_async(async_dbops: AsyncDBOps, calls: list) -> float:
+    """
+    Function to run the lookups concurrently, returning the elapsed seconds.
+    """
+
+    async def lookup(internal_id, series):
+        await async_dbops.get_patient_collection(internal_id, series)
+        await async_dbops.get_patient_model_list(internal_id, series)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(lookup(i, s) for i, s in calls))
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    """
+    Function to run the benchmark and print the timings.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db", default="inmemory")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    calls = list(itertools.islice(itertools.cycle(PATIENTS), args.calls))
+    async_dbops = AsyncDBOps(args.db, max_concurrency=args.concurrency)
+    dbops = async_dbops.dbops
+    # connect and warm up both paths before timing
+    run_sync(dbops, PATIENTS)
+    asyncio.run(run_async(async_dbops, PATIENTS))
+
+    sync_times = [run_sync(dbops, calls) for _ in range(args.repeat)]
+    async_times = [
+        asyncio.run(run_async(async_dbops, calls)) for _ in range(args.repeat)
+    ]
+    async_dbops.close()
+
+    for name, times in [("sync", sync_times), ("async", async_times)]:
+        median = statistics.median(times)
+        print(
+            "{:<6} {:>9.1f} ms/batch {:>9.3f} ms/call".format(
+                name, median * 1000, median * 1000 / args.calls
+            )
+        )
+    speed_up = statistics.median(sync_times) / statistics.median(async_times)
+    print("speed-up {:.2f}x".format(speed_up))
+
+
+if __name__ == "__main__":
+    main()
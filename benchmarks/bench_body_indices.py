@@ -0,0 +1,83 @@
+"""
+Benchmark of the scalar against the array calculate_bmi/calculate_mosteller_bsa.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_body_indices --rows 1000000 --missing 0.05
+
+The scalar version calls the functions once per patient, the array version once
+for all of them, from lists and from numpy arrays. A --missing fraction of the
+weights and heights is None.
+"""
+import argparse
+import random
+import statistics
+import time
+import numpy
+from main.utilities.utils import calculate_bmi, calculate_mosteller_bsa
+
+
+def run_scalar(weights: list, heights: list) -> float:
+    """
+    Function to compute the indices one patient at a time, returning the elapsed
+    seconds.
+    """
+    start = time.perf_counter()
+    for weight, height in zip(weights, heights):
+        calculate_bmi(weight, height)
+        calculate_mosteller_bsa(weight, height)
+    return time.perf_counter() - start
+
+
+def run_array(weights, heights) -> float:
+    """
+    Function to compute the indices of every patient at once, returning the
+    elapsed seconds.
+    """
+    start = time.perf_counter()
+    calculate_bmi(weights, heights)
+    calculate_mosteller_bsa(weights, heights)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    """
+    Function to run the benchmark and print the timings.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--missing", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    def sample(low: float, high: float) -> list:
+        return [
+            None if rng.random() < args.missing else round(rng.uniform(low, high), 1)
+            for _ in range(args.rows)
+        ]
+
+    weights, heights = sample(30, 150), sample(140, 210)
+    arrays = [numpy.array(i, dtype=float) for i in (weights, heights)]
+    runs = [
+        ("scalar", run_scalar, weights, heights),
+        ("list", run_array, weights, heights),
+        ("ndarray", run_array, *arrays),
+    ]
+
+    timings = {}
+    for name, run, *data in runs:
+        timings[name] = statistics.median(run(*data) for _ in range(args.repeat))
+        print(
+            "{:<8} {:>9.1f} ms {:>12.0f} rows/s".format(
+                name, timings[name] * 1000, args.rows / timings[name]
+            )
+        )
+    for name in list(timings)[1:]:
+        print("speed-up {:<8} {:.2f}x".format(name, timings["scalar"] / timings[name]))
+
+
+if __name__ == "__main__":
+    main()
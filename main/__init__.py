@@ -3,6 +3,7 @@ Main module
 """
 
 from . import database_ops
+from . import async_database_ops
 from . import utilities
 
-__all__ = ["database_ops", "utilities"]
+__all__ = ["database_ops", "async_database_ops", "utilities"]
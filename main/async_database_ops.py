@@ -0,0 +1,90 @@
+"""
+Asynchronous Database Operations Toolset
+"""
+import asyncio
+import functools
+import inspect
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from main.database_ops import DBOps
+
+
+class AsyncDBOps:
+    """
+    AsyncDBOps exposes every public DBOps tool as a coroutine with the same
+    signature (e.g. await AsyncDBOps("deploy").get_patient_collection(850)).
+
+    Calls run on a dedicated thread pool sharing the DBOps connection pool, so
+    several round trips can be in flight at once; max_concurrency bounds how many.
+    Generator tools (e.g. iter_cohort_patients) become async iterators, advanced
+    on the thread pool iter_batch items at a time.
+    """
+
+    iter_batch = 100
+
+    def __init__(self, db: str, max_concurrency: int = 16, **kwargs) -> None:
+        """
+        Initialize the desired database.
+
+        Args
+        ------
+            db: Database - see DBOps
+            max_concurrency: Maximum number of operations running at the same time
+
+        Kwargs
+        ------
+            Passed to DBOps (e.g. cache_size, cache_ttl)
+        """
+        self.dbops = DBOps(db, **kwargs)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="AsyncDBOps"
+        )
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.dbops, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        if inspect.isgeneratorfunction(attr):
+            return self._iterator(attr)
+
+        @functools.wraps(attr)
+        async def operation(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(attr, *args, **kwargs)
+            )
+
+        return operation
+
+    def _iterator(self, attr):
+        @functools.wraps(attr)
+        async def iterate(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            # creating the generator runs none of its code
+            iterator = attr(*args, **kwargs)
+            try:
+                while True:
+                    items = await loop.run_in_executor(
+                        self._executor,
+                        lambda: list(itertools.islice(iterator, self.iter_batch)),
+                    )
+                    for item in items:
+                        yield item
+                    if len(items) < self.iter_batch:
+                        return
+            finally:
+                await loop.run_in_executor(self._executor, iterator.close)
+
+        return iterate
+
+    async def __aenter__(self) -> "AsyncDBOps":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Function to wait for the running operations and release the thread pool.
+        """
+        self._executor.shutdown(wait=True)
@@ -1,107 +1,990 @@
 """
 Database Operations Toolset
 """
+# pylint: disable=too-many-lines
 import os
+import math
 import datetime
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
 import pymongo
-import pymongo_inmemory
-import yaml
 from bson import ObjectId
 from main.utilities.utils import (
+    add_test_data_to_db,
     calculate_bmi,
     calculate_mosteller_bsa,
-    add_test_data_to_db,
     json_printer,
     fcsv2list,
+    csv2dicts,
+    load_config,
 )
+from main.utilities.cache import DocumentCache
+from main.utilities.clients import get_client
+from main.utilities.local_db import project, seeded_database
+
+# Order of get_all_patients_patientcoll, later documents win for repeated ids
+PATIENT_LISTING_ORDER = [
+    ("internal_info.internal_id", pymongo.ASCENDING),
+    ("_id", pymongo.ASCENDING),
+]
+
+# Indexes serving the DBOps queries. The models and imaging documents are
+# referenced by _id, which the default _id index already covers.
+INDEXES = {
+    "patient": [
+        [
+            ("internal_info.internal_id", pymongo.ASCENDING),
+            ("internal_info.series", pymongo.ASCENDING),
+        ],
+        PATIENT_LISTING_ORDER,
+    ],
+    "patient-cohort": [
+        [("cohort_name", pymongo.ASCENDING)],
+        # multikey index: cohorts containing a patient
+        [("patient_ids", pymongo.ASCENDING)],
+    ],
+    "patient-cohort-membership": [
+        [("cohort_id", pymongo.ASCENDING), ("position", pymongo.ASCENDING)],
+        [("patient_id", pymongo.ASCENDING)],
+    ],
+}
+
+# Membership layouts: cohorts flagged {"membership": "collection"} keep one
+# document per member in the patient-cohort-membership collection instead of
+# their patient_ids array (see migrate_cohort_membership)
+MEMBERSHIP_COLLECTION = "collection"
+
+# Accepted patient origin_location values
+ORIGIN_LOCATIONS = [
+    "europe",
+    "asia_pacific",
+    "north_south_america",
+    "middle_east_africa",
+]
+
+# Largest cohort created with a patient_ids array, larger ones use the
+# membership collection
+EMBEDDED_MEMBERS_LIMIT = 10000
+
+# Age after which a membership document claimed by a removal that never
+# completed (e.g. the process died) can be claimed again
+MEMBERSHIP_CLAIM_TIMEOUT = datetime.timedelta(minutes=10)
+
+# Patient dimensions whose min/max are kept in the cohort documents
+COHORT_DIMENSIONS = ("height", "weight")
+
+# Patient fields summarised in the cohort documents' stats, with their fixed
+# histogram buckets: (lower edge of the first bucket, bucket width, buckets).
+# Values outside the range are counted in the first/last bucket.
+COHORT_STATISTICS = {
+    "age": (0, 10, 12),
+    "height": (100, 10, 12),
+    "weight": (20, 10, 16),
+    "bmi": (10, 2.5, 16),
+    "bsa": (0.5, 0.125, 20),
+}
+
+# Documents a patient bundle can join: name -> (patient field, collection)
+BUNDLE_REFERENCES = {
+    "models": ("models", "models"),
+    "imaging": ("imaging_data", "imaging"),
+}
+
+
+def _statistics_row(patient: dict) -> dict:
+    """
+    Contribution of a patient to the cohort statistics: the numeric value, its
+    square and its histogram bucket for every statistics field.
+    """
+    row = {"id": str(patient["_id"]), "values": {}, "squares": {}, "buckets": {}}
+    for field, (low, width, count) in COHORT_STATISTICS.items():
+        value = patient.get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            row["values"][field] = value
+            row["squares"][field] = value * value
+            row["buckets"][field] = min(
+                max(math.floor((value - low) / width), 0), count - 1
+            )
+    return row
+
+
+def _merge_statistics(rows: str) -> dict:
+    """
+    Pipeline update fields merging the statistics rows of the rows array into
+    the cohort statistics and widening the cohort dimension bounds.
+    """
+    fields = {
+        dim: {
+            "min": {"$min": ["$" + dim + ".min", {"$min": rows + ".values." + dim}]},
+            "max": {"$max": ["$" + dim + ".max", {"$max": rows + ".values." + dim}]},
+        }
+        for dim in COHORT_DIMENSIONS
+    }
+    fields["stats"] = {}
+    for field, (_, _, count) in COHORT_STATISTICS.items():
+        stats = "$stats." + field
+        fields["stats"][field] = {
+            "count": {
+                "$add": [
+                    {"$ifNull": [stats + ".count", 0]},
+                    {"$size": rows + ".values." + field},
+                ]
+            },
+            "sum": {
+                "$add": [
+                    {"$ifNull": [stats + ".sum", 0]},
+                    {"$sum": rows + ".values." + field},
+                ]
+            },
+            "sumsq": {
+                "$add": [
+                    {"$ifNull": [stats + ".sumsq", 0]},
+                    {"$sum": rows + ".squares." + field},
+                ]
+            },
+            "min": {"$min": [stats + ".min", {"$min": rows + ".values." + field}]},
+            "max": {"$max": [stats + ".max", {"$max": rows + ".values." + field}]},
+            "hist": _histogram(rows + ".buckets." + field, count, stats + ".hist"),
+        }
+    return fields
+
+
+def _histogram(buckets: str, count: int, base: str = None, subtract: bool = False):
+    """
+    Pipeline expression counting the bucket indexes of an array per bucket,
+    merged into (or, if subtract is set, removed from) the histogram array at
+    base when given.
+    """
+    hits = {
+        "$size": {"$filter": {"input": buckets, "cond": {"$eq": ["$$this", "$$i"]}}}
+    }
+    if base is not None:
+        hits = {
+            "$subtract"
+            if subtract
+            else "$add": [
+                {"$ifNull": [{"$arrayElemAt": [base, "$$i"]}, 0]},
+                hits,
+            ]
+        }
+    return {"$map": {"input": {"$range": [0, count]}, "as": "i", "in": hits}}
 
 
-class DBOps:
+def _remove_statistics(rows: str) -> dict:
+    """
+    Pipeline update fields removing the statistics rows of the rows array from
+    the cohort statistics. The min/max are left as they are, see
+    _holds_bounds.
+    """
+    fields = {"stats": {}}
+    for field, (_, _, count) in COHORT_STATISTICS.items():
+        stats = "$stats." + field
+        fields["stats"][field] = {
+            "count": {
+                "$subtract": [
+                    {"$ifNull": [stats + ".count", 0]},
+                    {"$size": rows + ".values." + field},
+                ]
+            },
+            "sum": {
+                "$subtract": [
+                    {"$ifNull": [stats + ".sum", 0]},
+                    {"$sum": rows + ".values." + field},
+                ]
+            },
+            "sumsq": {
+                "$subtract": [
+                    {"$ifNull": [stats + ".sumsq", 0]},
+                    {"$sum": rows + ".squares." + field},
+                ]
+            },
+            "min": stats + ".min",
+            "max": stats + ".max",
+            "hist": _histogram(
+                rows + ".buckets." + field, count, stats + ".hist", subtract=True
+            ),
+        }
+    return fields
+
+
+def _holds_bounds(cohort: dict, rows: list) -> bool:
+    """
+    Whether removing the statistics rows of patients from a cohort document
+    needs its bounds and statistics to be recomputed: a patient holds a min/max,
+    or does not fit the stored statistics (its demographics changed since it
+    was added).
+    """
+    for field, (_, _, count) in COHORT_STATISTICS.items():
+        values = [row["values"][field] for row in rows if field in row["values"]]
+        if not values:
+            continue
+        stats = cohort.get("stats", {}).get(field, {})
+        bounds = [(stats.get("min"), stats.get("max"))]
+        if field in COHORT_DIMENSIONS:
+            dim = cohort.get(field) or {}
+            bounds.append((dim.get("min"), dim.get("max")))
+        if any(
+            low is None or high is None or min(values) <= low or max(values) >= high
+            for low, high in bounds
+        ):
+            return True
+        hist = stats.get("hist", [0] * count)
+        buckets = [row["buckets"][field] for row in rows if field in row["buckets"]]
+        if stats.get("count", 0) < len(values) or any(
+            hist[i] < buckets.count(i) for i in set(buckets)
+        ):
+            return True
+    return False
+
+
+def _next_version() -> dict:
+    """
+    Pipeline update field incrementing the membership_version of a cohort,
+    changed by every update of its members.
+    """
+    return {
+        "membership_version": {"$add": [{"$ifNull": ["$membership_version", 0]}, 1]}
+    }
+
+
+def _member_stages(membership: bool = False, cohort_ids: list = None) -> list:
+    """
+    Aggregation stages over the patient-cohort collection (or, if membership is
+    set, the patient-cohort-membership collection) producing one document per
+    member of every cohort or only those of cohort_ids, with its patient
+    document joined as _patient (missing for unknown patients).
+    """
+    key = "cohort_id" if membership else "_id"
+    stages = []
+    if cohort_ids is not None:
+        stages = [{"$match": {key: {"$in": [ObjectId(i) for i in cohort_ids]}}}]
+    if membership:
+        member = "$patient_id"
+    else:
+        member = "$patient_ids"
+        stages += [
+            {
+                "$project": {
+                    "patient_ids": 1,
+                    "number_patients": {"$size": {"$ifNull": ["$patient_ids", []]}},
+                }
+            },
+            {"$unwind": {"path": "$patient_ids", "preserveNullAndEmptyArrays": True}},
+        ]
+    return stages + [
+        {
+            "$addFields": {
+                "_patient": {
+                    "$convert": {
+                        "input": member,
+                        "to": "objectId",
+                        "onError": None,
+                        "onNull": None,
+                    }
+                }
+            }
+        },
+        {
+            "$lookup": {
+                "from": "patient",
+                "localField": "_patient",
+                "foreignField": "_id",
+                "as": "_patient",
+            }
+        },
+        {"$unwind": {"path": "$_patient", "preserveNullAndEmptyArrays": True}},
+    ]
+
+
+def _cohort_rebuild_pipeline(membership: bool = False, cohort_ids: list = None) -> list:
+    """
+    Aggregation over the patient-cohort collection (or, if membership is set,
+    the patient-cohort-membership collection) recomputing, for every cohort or
+    only those of cohort_ids, number_patients and the statistics of its members: one
+    document per cohort with <field>_count/_sum/_sumsq/_min/_max/_hist for every
+    statistics field. Histograms are summed bucket by bucket, so the grouped
+    documents keep the same size whatever the number of members.
+    """
+    if membership:
+        group = {"_id": "$cohort_id", "number_patients": {"$sum": 1}}
+    else:
+        group = {"_id": "$_id", "number_patients": {"$first": "$number_patients"}}
+    buckets, histograms, counters = {}, {}, {}
+    for field, (low, width, count) in COHORT_STATISTICS.items():
+        value = "$_patient." + field
+        numeric = {"$in": [{"$type": value}, ["double", "int", "long", "decimal"]]}
+        buckets["_bucket_" + field] = {
+            "$cond": [
+                numeric,
+                {
+                    "$min": [
+                        {
+                            "$max": [
+                                {
+                                    "$floor": {
+                                        "$divide": [{"$subtract": [value, low]}, width]
+                                    }
+                                },
+                                0,
+                            ]
+                        },
+                        count - 1,
+                    ]
+                },
+                None,
+            ]
+        }
+        group.update(
+            {
+                field + "_count": {"$sum": {"$cond": [numeric, 1, 0]}},
+                field + "_sum": {"$sum": value},
+                field
+                + "_sumsq": {
+                    "$sum": {"$cond": [numeric, {"$multiply": [value, value]}, 0]}
+                },
+                field + "_min": {"$min": value},
+                field + "_max": {"$max": value},
+            }
+        )
+        for i in range(count):
+            counters["_" + field + "_hist_" + str(i)] = 0
+            group["_" + field + "_hist_" + str(i)] = {
+                "$sum": {"$cond": [{"$eq": ["$_bucket_" + field, i]}, 1, 0]}
+            }
+        histograms[field + "_hist"] = [
+            "$_" + field + "_hist_" + str(i) for i in range(count)
+        ]
+    return _member_stages(membership, cohort_ids) + [
+        {"$addFields": buckets},
+        {"$group": group},
+        {"$addFields": histograms},
+        {"$project": counters},
+    ]
+
+
+def _validate_demographics(**kwargs) -> dict:
+    """
+    Patient fields to set from update_human_demographics' kwargs, raising
+    ValueError on the first invalid value. None/zero values are left out.
+    """
+    unknown = set(kwargs) - {"age", "gender", "height", "weight", "loc"}
+    if unknown:
+        raise ValueError("Unknown demographic fields: {}.".format(sorted(unknown)))
+    age, gender, height, weight, origin_location = [
+        kwargs.get("age"),
+        kwargs.get("gender"),
+        kwargs.get("height"),
+        kwargs.get("weight"),
+        kwargs.get("loc"),
+    ]
+    if not isinstance(age, (int, float)) and age is not None:
+        raise ValueError("Age must be an integer or float.")
+    if age not in range(0, 121) and age is not None:
+        raise ValueError("Age not inside the valid range.")
+    if gender not in ["male", "female"] and gender is not None:
+        raise ValueError("Gender not male/female.")
+    for i in [height, weight]:
+        if not isinstance(i, (int, float)) and i is not None:
+            raise ValueError("Height/weight must be an integer or float.")
+    if origin_location not in ORIGIN_LOCATIONS and origin_location is not None:
+        raise ValueError("Origin location not in the accepted values/format.")
+    fields = {
+        "age": age,
+        "gender": gender,
+        "height": height,
+        "weight": weight,
+        "origin_location": origin_location,
+    }
+    return {field: value for field, value in fields.items() if value}
+
+
+def _demographics_update(fields: dict) -> list:
+    """
+    Pipeline update setting demographic fields and, when the height or weight
+    changes, the bmi and bsa computed from the new or stored values (rounded
+    like calculate_bmi/calculate_mosteller_bsa, left as is when either is
+    missing).
+    """
+    if not fields:
+        return []
+    pipeline = [{"$set": {k: {"$literal": v} for k, v in fields.items()}}]
+    if "height" in fields or "weight" in fields:
+        known = {"$and": [{"$gt": ["$height", 0]}, {"$gte": ["$weight", 0]}]}
+        pipeline.append(
+            {
+                "$set": {
+                    "bmi": {
+                        "$cond": [
+                            known,
+                            {
+                                "$round": [
+                                    {
+                                        "$divide": [
+                                            "$weight",
+                                            {
+                                                "$pow": [
+                                                    {"$divide": ["$height", 100]},
+                                                    2,
+                                                ]
+                                            },
+                                        ]
+                                    },
+                                    2,
+                                ]
+                            },
+                            "$bmi",
+                        ]
+                    },
+                    "bsa": {
+                        "$cond": [
+                            known,
+                            {
+                                "$round": [
+                                    {
+                                        "$sqrt": {
+                                            "$divide": [
+                                                {"$multiply": ["$weight", "$height"]},
+                                                3600,
+                                            ]
+                                        }
+                                    },
+                                    2,
+                                ]
+                            },
+                            "$bsa",
+                        ]
+                    },
+                }
+            }
+        )
+    return pipeline
+
+
+def _membership_id(cohort_id: Union[str, ObjectId], patient_id: str) -> str:
+    """
+    _id of the membership document of a patient in a cohort.
+    """
+    return "{}:{}".format(cohort_id, patient_id)
+
+
+def _member_projection(projection: Union[list, dict, None]) -> tuple:
+    """
+    Cohort projection extended with the membership layout flag when the
+    patient_ids are requested, whether they are requested and whether the
+    flag was added to the projection.
+    """
+    if isinstance(projection, list):
+        projection = dict.fromkeys(projection, 1)
+    if not projection:
+        return projection, True, False
+    if not any(v for k, v in projection.items() if k != "_id"):
+        return projection, projection.get("patient_ids", 1) not in (0, False), False
+    if not projection.get("patient_ids") or "membership" in projection:
+        return projection, bool(projection.get("patient_ids")), False
+    return {**projection, "membership": 1}, True, True
+
+
+def _keeping_id(projection: Union[list, dict, None]) -> tuple:
+    """
+    Projection also returning _id, and whether the projection excluded it.
+    """
+    if not isinstance(projection, dict) or projection.get("_id", 1) not in (0, False):
+        return projection, False
+    return {k: v for k, v in projection.items() if k != "_id"} or None, True
+
+
+def _set_bounds(bounds: dict) -> dict:
+    """
+    $set fields replacing the cohort min/max of every dimension.
+    """
+    return {
+        dim + "." + key: value
+        for dim, (low, high) in bounds.items()
+        for key, value in (("min", low), ("max", high))
+    }
+
+
+def _projection(fields: Union[list, dict, None]) -> Union[list, dict, None]:
+    """
+    Server projection of a getter's fields argument: a list of fields to
+    include or a {field: 0/1} dict.
+    """
+    if fields is None or isinstance(fields, dict):
+        return fields
+    return list(fields)
+
+
+def _including(
+    projection: Union[list, dict, None], field: str
+) -> Union[list, dict, None]:
+    """
+    Server projection also returning field (and its subfields) whatever the
+    projection includes or excludes.
+    """
+    if projection is None:
+        return None
+    if isinstance(projection, list):
+        return projection + [field]
+    projection = {
+        k: v
+        for k, v in projection.items()
+        if k != field and not k.startswith(field + ".")
+    }
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if any(fields.values()) or (not fields and projection.get("_id")):
+        projection[field] = 1
+    return projection or None
+
+
+def _as_list(series: Union[str, tuple, list, None]) -> Union[str, list, None]:
+    return list(series) if isinstance(series, tuple) else series
+
+
+def _patient_query(internal_id: int, series: Union[str, list, None]) -> dict:
+    query = {"internal_info.internal_id": internal_id}
+    if isinstance(series, list) and series:
+        # matches the series in any order, in a single query
+        query["internal_info.series"] = {"$all": series, "$size": len(series)}
+    elif series:
+        query["internal_info.series"] = series
+        # a string must not match an element of a multi-series array
+        query["internal_info.series.0"] = {"$exists": False}
+    return query
+
+
+def _patient_matches(
+    doc: dict, internal_id: int, series: Union[str, list, None]
+) -> bool:
+    """
+    Client-side counterpart of _patient_query.
+    """
+    info = doc.get("internal_info", {})
+    if info.get("internal_id") != internal_id:
+        return False
+    if isinstance(series, list) and series:
+        return (
+            isinstance(info.get("series"), list)
+            and len(info["series"]) == len(series)
+            and set(series) <= set(info["series"])
+        )
+    if series:
+        return info.get("series") == series
+    return True
+
+
+def _bundle_stages(include: tuple) -> list:
+    """
+    Aggregation stages joining the referenced documents of a patient bundle
+    into _bundle_<name> arrays.
+    """
+    unknown = set(include) - set(BUNDLE_REFERENCES)
+    if unknown:
+        raise ValueError("Unknown bundle documents: {}.".format(sorted(unknown)))
+    stages = []
+    for name in include:
+        field, collection = BUNDLE_REFERENCES[name]
+        stages += [
+            {
+                "$addFields": {
+                    "_bundle_"
+                    + name: {
+                        "$convert": {
+                            "input": "$" + field,
+                            "to": "objectId",
+                            "onError": "$" + field,
+                            "onNull": None,
+                        }
+                    }
+                }
+            },
+            {
+                "$lookup": {
+                    "from": collection,
+                    "localField": "_bundle_" + name,
+                    "foreignField": "_id",
+                    "as": "_bundle_" + name,
+                }
+            },
+        ]
+    return stages
+
+
+def _bundle(patient: dict, include: tuple) -> dict:
+    """
+    Patient bundle of a patient document joined by _bundle_stages.
+    """
+    bundle = {"patient": patient}
+    for name in include:
+        joined = patient.pop("_bundle_" + name)
+        bundle[name] = joined[0] if joined else None
+    return bundle
+
+
+def _prefetched(fetch, chunks: list):
+    """
+    Generator over fetch(chunk) for every chunk, the next chunk being fetched
+    on a background thread while the current result is consumed.
+    """
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        pending = prefetch.submit(fetch, chunks[0]) if chunks else None
+        for index in range(len(chunks)):
+            result = pending.result()
+            if index + 1 < len(chunks):
+                pending = prefetch.submit(fetch, chunks[index + 1])
+            yield result
+
+
+def _pair_keys(pairs: list) -> list:
+    """
+    Unique (internal_id, series) pairs, list series being turned into tuples.
+    """
+    return list(
+        dict.fromkeys((i, tuple(s) if isinstance(s, list) else s) for i, s in pairs)
+    )
+
+
+def _patient_key(internal_id: int, series: Union[str, tuple, list, None]) -> tuple:
+    if isinstance(series, (list, tuple)):
+        series = tuple(sorted(series))
+    return ("patient", internal_id, series)
+
+
+class DBOps:  # pylint: disable=too-many-public-methods
     """
     DBOps contains several tools to access, retrieve, modify and upload information
     to a azure cosmosdb nosql database.
     """
 
-    def __init__(self, db: str) -> None:
+    supported_dbs = ("dev", "deploy", "inmemory", "local")
+
+    def __init__(
+        self, db: str, cache_size: int = 0, cache_ttl: Union[int, float] = None
+    ) -> None:
         """
         Initialize the desired database.
+        The connection is only opened on the first access to the database.
 
         Args
         ------
-            db: Database - development ('dev'), deployment ('deploy'), in-memory ('inmemory')
+            db: Database - development ('dev'), deployment ('deploy'), in-memory ('inmemory'),
+                pure-Python local ('local')
+            cache_size: Number of patient, models and imaging documents kept in an
+                in-process LRU cache, invalidated by the DBOps writes (0 disables it)
+            cache_ttl: Seconds a cached document stays valid, None for no expiry
+
+        The 'dev' and 'deploy' clients are shared process-wide, see
+        main.utilities.clients.close_all to release them on shutdown.
+        """
+        if db not in self.supported_dbs:
+            raise ValueError("DB not supported.")
+        self.db_name = db
+        self.cache = DocumentCache(cache_size, cache_ttl) if cache_size else None
+        self._database = None
+        self._connect_lock = threading.Lock()
 
+    @property
+    def database(self) -> pymongo.database.Database:
         """
-        root_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
-        with open(os.path.join(root_dir, "config.yaml"), encoding="utf-8") as yml:
-            cfg = yaml.full_load(yml)
-        if db == "dev":
-            client = pymongo.MongoClient(cfg["cosmosdb"]["dev2"]["conn_str"])
-            self.database = client[cfg["database"]]
-        elif db == "deploy":
-            client = pymongo.MongoClient(cfg["cosmosdb"]["dep"]["conn_str"])
-            self.database = client[cfg["database"]]
-        elif db == "inmemory":
-            client = pymongo_inmemory.MongoClient()
-            self.database = client.testdb
-            add_test_data_to_db(self.database, cfg["collections"])
+        Database handle, connected on first access.
+        """
+        if self._database is None:
+            with self._connect_lock:
+                if self._database is None:
+                    self._database = self._connect()
+        return self._database
+
+    def _connect(self) -> pymongo.database.Database:
+        cfg = load_config()
+        if self.db_name == "dev":
+            client = get_client(cfg["cosmosdb"]["dev2"])
+            return client[cfg["database"]]
+        if self.db_name == "deploy":
+            client = get_client(cfg["cosmosdb"]["dep"])
+            return client[cfg["database"]]
+        if self.db_name == "local":
+            database = seeded_database(cfg["collections"])
         else:
-            raise ValueError("DB not supported.")
+            import pymongo_inmemory  # pylint: disable=import-outside-toplevel
+
+            client = pymongo_inmemory.MongoClient()
+            database = client.testdb
+            add_test_data_to_db(database, cfg["collections"])
+        self._create_indexes(database)
+        return database
+
+    @staticmethod
+    def _create_indexes(database: pymongo.database.Database) -> list:
+        return [
+            database[collection].create_index(keys)
+            for collection, indexes in INDEXES.items()
+            for keys in indexes
+        ]
+
+    def ensure_indexes(self) -> list:
+        """
+        Function to create the indexes used by the DBOps queries.
+        Indexes that already exist are left untouched.
+
+        Return
+        ------
+            Names of the indexes
+        """
+        return self._create_indexes(self.database)
+
+    def _cached(self, key: tuple, load, fields: Union[list, dict] = None):
+        """
+        Cached result of load(projection). Only whole documents are cached: a
+        miss loads the whole document(s) and projected reads are served from
+        them, so repeated lookups of a reference field hit the cache.
+        """
+        projection = _projection(fields)
+        if self.cache is None:
+            return load(projection)
+        value = self.cache.get_or_load(key, lambda: load(None))
+        if projection is None or not value:
+            return value
+        if isinstance(value, list):
+            return [project(doc, projection) for doc in value]
+        return project(value, projection)
+
+    def _invalidate_patient(self, internal_id: int) -> None:
+        if self.cache is not None:
+            self.cache.invalidate_where(
+                lambda key: key[0] == "patient" and key[1] == internal_id
+            )
+
+    def _invalidate_models(self, models_id: Union[str, ObjectId]) -> None:
+        if self.cache is not None:
+            self.cache.invalidate(("models", ObjectId(models_id)))
 
     def get_patient_collection(
-        self, internal_id: int, series: Union[str, list] = None
+        self,
+        internal_id: int,
+        series: Union[str, list] = None,
+        fields: Union[list, dict] = None,
     ) -> list:
         """
         Function to retrieve the patient collection document(s) for a specific patient.
         If series name not specified, the function will return the only patient entry
-        for that human_id.
+        for that human_id. A list of series matches regardless of its order.
 
         Args
         ------
             internal_id:  Human internal ID
             series: Series name
+            fields: Fields to return, as a list to include or a {field: 0/1} projection
 
         Return
         ------
             List of patient collection document(s)
         """
 
-        def to_query(internal_id, series):
-            if series:
-                query = list(
-                    self.database.patient.find(
-                        {
-                            "internal_info": {
-                                "internal_id": internal_id,
-                                "series": series,
-                            }
-                        }
-                    )
-                )
-                if len(query) > 1:
-                    json_printer(query)
-                    raise SystemExit("More than one patient entry found.")
-                return query
+        query = _patient_query(internal_id, series)
 
-            query = list(
-                self.database.patient.find({"internal_info.internal_id": internal_id})
-            )
-            if len(query) > 1:
-                json_printer(query)
+        def to_query(projection):
+            docs = list(self.database.patient.find(query, projection))
+            if len(docs) > 1:
+                json_printer(docs)
                 raise SystemExit("More than one patient entry found.")
-            return query
+            return docs
 
-        if isinstance(series, list):
-            query = to_query(internal_id, series)
-            if query == []:
-                query = to_query(internal_id, [series[1], series[0]])
-            return query
+        return self._cached(_patient_key(internal_id, series), to_query, fields)
 
-        return to_query(internal_id, series)
+    def get_patient_collections(
+        self, pairs: list, chunk_size: int = 200, fields: Union[list, dict] = None
+    ) -> dict:
+        """
+        Function to retrieve the patient collection documents of many patients,
+        using one query per chunk of (internal_id, series) pairs.
+        As in get_patient_collection, a pair matching more than one patient entry
+        is an error.
+
+        Args
+        ------
+            pairs: List of (internal_id, series) pairs, series may be None
+            chunk_size: Number of pairs resolved per query
+            fields: Fields to return, as a list to include or a {field: 0/1} projection,
+                internal_info is always included
+
+        Return
+        ------
+            Dict of pair -> patient collection document (None if not found),
+            list series being turned into tuples
+        """
+
+        projection = _including(_projection(fields), "internal_info")
+        found = dict.fromkeys(_pair_keys(pairs))
+        missing = []
+        for pair in found:
+            cached = self.cache.get(_patient_key(*pair)) if self.cache else None
+            if cached is None:
+                missing.append(pair)
+            else:
+                found[pair] = project(cached.pop(), projection)
+
+        matched = self._resolve_pairs(
+            missing,
+            chunk_size,
+            lambda query: self.database.patient.find(
+                query, None if self.cache else projection
+            ),
+        )
+        for pair, docs in matched.items():
+            if docs and self.cache is not None:
+                self.cache.put(_patient_key(*pair), docs)
+                docs = [project(docs[0], projection)]
+            found[pair] = docs[0] if docs else None
+        return found
+
+    @staticmethod
+    def _resolve_pairs(pairs: list, chunk_size: int, fetch) -> dict:
+        """
+        Patient documents of (internal_id, series) pairs, fetched with one
+        fetch($or query) call per chunk and assigned back to their pair.
+        """
+        matched = {}
+        for start in range(0, len(pairs), chunk_size):
+            chunk = pairs[start : start + chunk_size]
+            docs = list(
+                fetch({"$or": [_patient_query(i, _as_list(s)) for i, s in chunk]})
+            )
+            for internal_id, series in chunk:
+                matched[(internal_id, series)] = [
+                    doc
+                    for doc in docs
+                    if _patient_matches(doc, internal_id, _as_list(series))
+                ]
+                if len(matched[(internal_id, series)]) > 1:
+                    json_printer(matched[(internal_id, series)])
+                    raise SystemExit("More than one patient entry found.")
+        return matched
+
+    def get_patient_bundle(
+        self,
+        internal_id: int,
+        series: Union[str, list] = None,
+        include: tuple = ("models", "imaging"),
+    ) -> Union[dict, None]:
+        """
+        Function to retrieve a patient collection document together with its
+        models and/or imaging collection documents, joined server-side in a
+        single aggregation.
+
+        Args
+        ------
+            internal_id:  Human internal ID
+            series: Series name
+            include: Referenced documents to join, "models" and/or "imaging"
+
+        Return
+        ------
+            Dict with the "patient" document and the included "models"/"imaging"
+            documents (None when not referenced), None if the patient is not found
+        """
+        bundles = self.get_patient_bundles([(internal_id, series)], include=include)
+        return next(iter(bundles.values()))
+
+    def get_patient_bundles(
+        self,
+        pairs: list,
+        include: tuple = ("models", "imaging"),
+        chunk_size: int = 200,
+    ) -> dict:
+        """
+        Function to retrieve the patient bundles (see get_patient_bundle) of many
+        patients, using one aggregation per chunk of (internal_id, series) pairs.
+
+        Args
+        ------
+            pairs: List of (internal_id, series) pairs, series may be None
+            include: Referenced documents to join, "models" and/or "imaging"
+            chunk_size: Number of pairs resolved per aggregation
+
+        Return
+        ------
+            Dict of pair -> patient bundle (None if not found),
+            list series being turned into tuples
+        """
+        stages = _bundle_stages(include)
+        bundles = {}
+        for pair, docs in self._resolve_pairs(
+            _pair_keys(pairs),
+            chunk_size,
+            lambda query: self.database.patient.aggregate([{"$match": query}] + stages),
+        ).items():
+            bundles[pair] = _bundle(docs[0], include) if docs else None
+        return bundles
+
+    def iter_cohort_patients(
+        self,
+        cohort_id: str,
+        fields: Union[list, dict] = None,
+        chunk_size: int = 500,
+        include: tuple = (),
+    ):
+        """
+        Generator over the patient documents of a cohort's members, in member
+        order. Members are fetched chunk_size at a time with one $in query per
+        chunk, the next chunk being fetched in the background while the current
+        one is consumed. Members without a patient document are skipped.
+
+        Args
+        ------
+            cohort_id:  Patient cohort objectID
+            fields: Patient fields to return, as a list to include or a
+                {field: 0/1} projection
+            chunk_size: Number of patients fetched per query
+            include: Referenced documents to join, "models" and/or "imaging"
+
+        Yield
+        ------
+            Patient documents, or patient bundles (see get_patient_bundle) when
+            include is set
+        """
+        stages = _bundle_stages(include)
+        projection = _projection(fields)
+        if isinstance(projection, list):
+            projection = dict.fromkeys(projection, 1)
+        # _id is needed to restore the member order
+        keep_id = projection is None or projection.get("_id", 1) not in (0, False)
+        if not keep_id:
+            del projection["_id"]
+            # an empty projection would only return _id
+            projection = projection or None
+        if projection and stages:
+            if all(projection.values()):
+                projection.update(dict.fromkeys(("_bundle_" + i for i in include), 1))
+            stages.append({"$project": projection})
+
+        def fetch(chunk: list) -> list:
+            query = {"_id": {"$in": [ObjectId(i) for i in chunk]}}
+            if stages:
+                docs = self.database.patient.aggregate([{"$match": query}] + stages)
+            else:
+                docs = self.database.patient.find(query, projection)
+            docs = {str(doc["_id"]): doc for doc in docs}
+            docs = [docs[i] for i in chunk if i in docs]
+            for doc in docs if not keep_id else ():
+                del doc["_id"]
+            return docs
+
+        patient_ids = self._cohort_members(self._find_cohort(cohort_id))
+        chunks = [
+            patient_ids[start : start + chunk_size]
+            for start in range(0, len(patient_ids), chunk_size)
+        ]
+        for docs in _prefetched(fetch, chunks):
+            for doc in docs:
+                yield _bundle(doc, include) if include else doc
 
     def get_patient_imaging_collection(
-        self, internal_id: int, series: Union[str, list] = None
+        self,
+        internal_id: int,
+        series: Union[str, list] = None,
+        fields: Union[list, dict] = None,
     ) -> dict:
         """
         Function to retrieve a patient's imaging collection document for a specific patient.
@@ -110,16 +993,28 @@ class DBOps:
         ------
             internal_id:  Human internal ID
             series: Series name
+            fields: Fields to return, as a list to include or a {field: 0/1} projection
 
         Return
         ------
             Patient's imaging collection document
         """
-        imaging_id = self.get_patient_collection(internal_id, series)[0]["imaging_data"]
-        return self.database.imaging.find_one({"_id": imaging_id})
+        imaging_id = self.get_patient_collection(
+            internal_id, series, fields=["imaging_data"]
+        )[0]["imaging_data"]
+        return self._cached(
+            ("imaging", imaging_id),
+            lambda projection: self.database.imaging.find_one(
+                {"_id": imaging_id}, projection
+            ),
+            fields,
+        )
 
     def get_patient_model_collection(
-        self, internal_id: int, series: Union[str, list] = None
+        self,
+        internal_id: int,
+        series: Union[str, list] = None,
+        fields: Union[list, dict] = None,
     ) -> dict:
         """
         Function to retrieve a patient's models collection document for a specific patient.
@@ -128,14 +1023,25 @@ class DBOps:
         ------
             internal_id:  Human internal ID
             series: Series name
+            fields: Fields to return, as a list to include or a {field: 0/1} projection
 
         Return
         ------
             Patient's imaging collection document
         """
 
-        models_id = self.get_patient_collection(internal_id, series)[0]["models"]
-        return self.database.models.find_one({"_id": ObjectId(models_id)})
+        models_id = ObjectId(
+            self.get_patient_collection(internal_id, series, fields=["models"])[0][
+                "models"
+            ]
+        )
+        return self._cached(
+            ("models", models_id),
+            lambda projection: self.database.models.find_one(
+                {"_id": models_id}, projection
+            ),
+            fields,
+        )
 
     def get_patient_cohort(self, **kwargs) -> Union[list, dict]:
         """
@@ -145,27 +1051,225 @@ class DBOps:
         ------
             cohort_name(str): Patient cohort name
             cohort_id(str): Patient cohort object ID
+            fields(list|dict): Fields to return, as a list to include or a
+                {field: 0/1} projection
 
         Return
         ------
             Patient cohort document/list
         """
         cohort_name, cohort_id = [kwargs.get("cohort_name"), kwargs.get("cohort_id")]
+        projection = _projection(kwargs.get("fields"))
         if cohort_name is not None and cohort_id is not None:
             raise SystemExit("Provide either the cohort name or the cohort id.")
         if cohort_name:
-            return list(
-                self.database["patient-cohort"].find({"cohort_name": cohort_name})
+            return self._with_members(
+                lambda query_projection: self.database["patient-cohort"].find(
+                    {"cohort_name": cohort_name}, query_projection
+                ),
+                projection,
             )
         if cohort_id:
-            return self.database["patient-cohort"].find_one(
-                {"_id": ObjectId(cohort_id)}
+            cohorts = self._with_members(
+                lambda query_projection: self.database["patient-cohort"].find(
+                    {"_id": ObjectId(cohort_id)}, query_projection, limit=1
+                ),
+                projection,
             )
+            return cohorts[0] if cohorts else None
         return None
 
+    def _with_members(self, find, projection: Union[list, dict, None]) -> list:
+        """
+        Cohort documents returned by find(projection), with the patient_ids of
+        the cohorts using the membership collection filled in when requested.
+        """
+        projection, drop_id = _keeping_id(projection)
+        query_projection, wanted, added = _member_projection(projection)
+        cohorts = list(find(query_projection))
+        for cohort in cohorts:
+            if wanted and cohort.get("membership") == MEMBERSHIP_COLLECTION:
+                cohort["patient_ids"] = self._cohort_members(cohort)
+            if added:
+                cohort.pop("membership", None)
+            if drop_id:
+                del cohort["_id"]
+        return cohorts
+
+    def _find_cohort(
+        self, cohort_id: str, projection: tuple = ("patient_ids", "membership")
+    ) -> dict:
+        """
+        Cohort document with the projected fields, by default what
+        _cohort_members needs to list its member ids.
+        """
+        cohort = self.database["patient-cohort"].find_one(
+            {"_id": ObjectId(cohort_id)}, list(projection)
+        )
+        if cohort is None:
+            raise SystemExit("Patient cohort not found.")
+        return cohort
+
+    def _cohort_members(self, cohort: dict) -> list:
+        """
+        Member patient ObjectIDs of a cohort document, read from the membership
+        collection, in insertion order, for the cohorts using it.
+        """
+        if cohort.get("membership") != MEMBERSHIP_COLLECTION:
+            return cohort.get("patient_ids", [])
+        return [
+            doc["patient_id"]
+            for doc in self.database["patient-cohort-membership"].find(
+                {"cohort_id": cohort["_id"]},
+                {"_id": 0, "patient_id": 1},
+                sort=[("position", pymongo.ASCENDING)],
+            )
+        ]
+
+    def get_cohorts_for_patient(
+        self, patient_id: Union[str, ObjectId], fields: Union[list, dict] = None
+    ) -> list:
+        """
+        Function to retrieve the patient cohorts a patient belongs to.
+
+        Args
+        ------
+            patient_id: ObjectID of the patient's collection document
+            fields: Fields to return, as a list to include or a {field: 0/1}
+                projection (e.g. ["cohort_name"] to skip the member lists)
+
+        Return
+        ------
+            Patient cohort documents
+        """
+        query = {"patient_ids": str(patient_id)}
+        bucketed = [
+            doc["cohort_id"]
+            for doc in self.database["patient-cohort-membership"].find(
+                {"patient_id": str(patient_id)}, {"_id": 0, "cohort_id": 1}
+            )
+        ]
+        if bucketed:
+            query = {"$or": [query, {"_id": {"$in": bucketed}}]}
+        return self._with_members(
+            lambda projection: self.database["patient-cohort"].find(query, projection),
+            _projection(fields),
+        )
+
+    def get_cohorts_for_patients(
+        self, patient_ids: list, fields: Union[list, dict] = None
+    ) -> dict:
+        """
+        Function to retrieve the patient cohorts of several patients in a single
+        query.
+
+        Args
+        ------
+            patient_ids: ObjectIDs of patients' collection documents
+            fields: Fields to return, as a list to include or a {field: 0/1}
+                projection (e.g. ["cohort_name"] to skip the member lists)
+
+        Return
+        ------
+            Dict of patient ObjectID (str) -> patient cohort documents
+        """
+        patient_ids = list(dict.fromkeys(str(i) for i in patient_ids))
+        bucketed = {}
+        for doc in self.database["patient-cohort-membership"].find(
+            {"patient_id": {"$in": patient_ids}}, {"_id": 0}
+        ):
+            bucketed.setdefault(doc["cohort_id"], []).append(doc["patient_id"])
+        query = {"patient_ids": {"$in": patient_ids}}
+        if bucketed:
+            query = {"$or": [query, {"_id": {"$in": list(bucketed)}}]}
+        pipeline = [
+            {"$match": query},
+            {
+                "$addFields": {
+                    "_members": {
+                        "$setIntersection": [
+                            {"$ifNull": ["$patient_ids", []]},
+                            {"$literal": patient_ids},
+                        ]
+                    }
+                }
+            },
+        ]
+
+        def aggregate(projection):
+            if projection and any(
+                v for k, v in projection.items() if k != "_id" or len(projection) == 1
+            ):
+                projection = {**projection, "_members": 1}
+            return self.database["patient-cohort"].aggregate(
+                pipeline + ([{"$project": projection}] if projection else [])
+            )
+
+        # _id is needed to match the cohorts using the membership collection
+        projection, drop_id = _keeping_id(_projection(fields))
+        cohorts = {patient_id: [] for patient_id in patient_ids}
+        for cohort in self._with_members(aggregate, projection):
+            members = cohort.pop("_members") + bucketed.get(cohort["_id"], [])
+            if drop_id:
+                del cohort["_id"]
+            for patient_id in members:
+                cohorts[patient_id].append(cohort)
+        return cohorts
+
+    def get_cohort_statistics(self, cohort_id: str) -> dict:
+        """
+        Function to retrieve the summary statistics of a patient cohort, read
+        from the statistics add_patients_to_cohort keeps in the cohort document.
+
+        Args
+        ------
+            cohort_id:  Patient cohort objectID
+
+        Return
+        ------
+            Dict of field (age, height, weight, bmi, bsa) -> count, mean, std,
+            min, max and histogram (list of bucket min, max and count)
+        """
+        cohort_doc = self.database["patient-cohort"].find_one(
+            {"_id": ObjectId(cohort_id)}, {"stats"}
+        )
+        if cohort_doc is None:
+            raise SystemExit("Patient cohort not found.")
+        summary = {}
+        for field, (low, width, count) in COHORT_STATISTICS.items():
+            stats = cohort_doc.get("stats", {}).get(field, {})
+            number = stats.get("count", 0)
+            mean = stats["sum"] / number if number else None
+            summary[field] = {
+                "count": number,
+                "mean": mean,
+                "std": (
+                    max(stats["sumsq"] / number - mean * mean, 0) ** 0.5
+                    if number
+                    else None
+                ),
+                "min": stats.get("min"),
+                "max": stats.get("max"),
+                "histogram": [
+                    {
+                        "min": low + i * width,
+                        "max": low + (i + 1) * width,
+                        "count": n,
+                    }
+                    for i, n in enumerate(stats.get("hist", [0] * count))
+                ],
+            }
+        return summary
+
     def add_patients_to_cohort(self, cohort_id: str, patient_ids: list) -> list:
         """
         Function to add patients to a specific patient cohort.
+        The patients' dimensions are fetched in one query and the cohort is
+        updated atomically in a second one, whatever the number of patients
+        (cohorts using the membership collection then look up their layout and
+        insert the members first).
+        The height/weight bounds and the cohort statistics (see
+        get_cohort_statistics) are updated with the patients not yet in it.
 
         Args
         ------
@@ -176,77 +1280,614 @@ class DBOps:
         ------
             Cohort patients ObjectIDs
         """
+        patient_ids = list(dict.fromkeys(patient_ids))
+        rows = self._statistics_rows(patient_ids)
+        members = {"$ifNull": ["$patient_ids", []]}
+        pipeline = [
+            {
+                "$set": {
+                    "patient_ids": {
+                        "$concatArrays": [
+                            members,
+                            {
+                                "$filter": {
+                                    "input": {"$literal": patient_ids},
+                                    "cond": {"$not": [{"$in": ["$$this", members]}]},
+                                }
+                            },
+                        ]
+                    },
+                    "_added": {
+                        "$filter": {
+                            "input": {"$literal": rows},
+                            "cond": {"$not": [{"$in": ["$$this.id", members]}]},
+                        }
+                    },
+                }
+            },
+            {
+                "$set": {
+                    "number_patients": {"$size": "$patient_ids"},
+                    **_merge_statistics("$_added"),
+                    **_next_version(),
+                }
+            },
+            {"$unset": "_added"},
+        ]
+        cohort = self.database["patient-cohort"].find_one_and_update(
+            {"_id": ObjectId(cohort_id), "membership": {"$ne": MEMBERSHIP_COLLECTION}},
+            pipeline,
+            projection={"patient_ids"},
+            return_document=pymongo.ReturnDocument.AFTER,
+        )
+        if cohort is not None:
+            return cohort["patient_ids"]
 
+        cohort = self._find_cohort(cohort_id, ["membership"])
+        added = self._insert_members(cohort_id, patient_ids)
         self.database["patient-cohort"].update_one(
             {"_id": ObjectId(cohort_id)},
-            {"$addToSet": {"patient_ids": {"$each": patient_ids}}},
+            [
+                {
+                    "$set": {
+                        "_added": {
+                            "$literal": [row for row in rows if row["id"] in added]
+                        }
+                    }
+                },
+                {
+                    "$set": {
+                        "number_patients": {
+                            "$add": [
+                                {"$ifNull": ["$number_patients", 0]},
+                                len(added),
+                            ]
+                        },
+                        **_merge_statistics("$_added"),
+                        **_next_version(),
+                    }
+                },
+                {"$unset": "_added"},
+            ],
         )
-        self.database["patient-cohort"].update_one(
+        return self._cohort_members(cohort)
+
+    def remove_patients_from_cohort(self, cohort_id: str, patient_ids: list) -> list:
+        """
+        Function to remove patients from a specific patient cohort.
+        The members are removed and their statistics subtracted atomically. The
+        bounds and the statistics are only recomputed server-side from the
+        remaining members when a removed patient held a min/max or does not fit
+        the statistics (its demographics changed since it was added), and are
+        left to rebuild_all_cohort_stats if the members changed meanwhile.
+
+        Args
+        ------
+            cohort_id:  Patient cohort objectID
+            patient_ids: ObjectIDs of patients' collection documents
+
+        Return
+        ------
+            Cohort patients ObjectIDs
+        """
+        patient_ids = list(dict.fromkeys(patient_ids))
+        rows = self._statistics_rows(patient_ids)
+        members = {"$ifNull": ["$patient_ids", []]}
+        projection = ["membership", "patient_ids", "stats", *COHORT_DIMENSIONS]
+        cohort = self.database["patient-cohort"].find_one_and_update(
+            {"_id": ObjectId(cohort_id), "membership": {"$ne": MEMBERSHIP_COLLECTION}},
+            [
+                {
+                    "$set": {
+                        "patient_ids": {
+                            "$filter": {
+                                "input": members,
+                                "cond": {
+                                    "$not": [
+                                        {"$in": ["$$this", {"$literal": patient_ids}]}
+                                    ]
+                                },
+                            }
+                        },
+                        "_removed": {
+                            "$filter": {
+                                "input": {"$literal": rows},
+                                "cond": {"$in": ["$$this.id", members]},
+                            }
+                        },
+                    }
+                },
+                {
+                    "$set": {
+                        "number_patients": {"$size": "$patient_ids"},
+                        **_remove_statistics("$_removed"),
+                        **_next_version(),
+                    }
+                },
+                {"$unset": "_removed"},
+            ],
+            projection=projection,
+        )
+        if cohort is not None:
+            removed = set(cohort.get("patient_ids", [])) & set(patient_ids)
+            remaining = [i for i in cohort.get("patient_ids", []) if i not in removed]
+            rows = [row for row in rows if row["id"] in removed]
+        else:
+            cohort = self._find_cohort(cohort_id, ["membership"])
+            removed = self._delete_members(cohort_id, patient_ids)
+            rows = [row for row in rows if row["id"] in removed]
+            if removed:
+                cohort = self.database["patient-cohort"].find_one_and_update(
+                    {"_id": ObjectId(cohort_id)},
+                    [
+                        {"$set": {"_removed": {"$literal": rows}}},
+                        {
+                            "$set": {
+                                "number_patients": {
+                                    "$subtract": [
+                                        {"$ifNull": ["$number_patients", 0]},
+                                        len(removed),
+                                    ]
+                                },
+                                **_remove_statistics("$_removed"),
+                                **_next_version(),
+                            }
+                        },
+                        {"$unset": "_removed"},
+                    ],
+                    projection=projection,
+                )
+            remaining = None
+        if _holds_bounds(cohort, rows):
+            self._rebuild_cohorts([cohort_id], unchanged=True)
+        if remaining is None:
+            return self._cohort_members(cohort)
+        return remaining
+
+    def _statistics_rows(self, patient_ids: list) -> list:
+        """
+        Statistics rows (see _statistics_row) of the patients of patient_ids
+        that have a patient document.
+        """
+        if not patient_ids:
+            return []
+        return [
+            _statistics_row(i)
+            for i in self.database.patient.find(
+                {"_id": {"$in": [ObjectId(i) for i in patient_ids]}},
+                dict.fromkeys(COHORT_STATISTICS, 1),
+            )
+        ]
+
+    def _insert_members(self, cohort_id: str, patient_ids: list) -> set:
+        """
+        Insert the membership documents of patients in a cohort using the
+        membership collection, returning the patients that were not members.
+        """
+        if not patient_ids:
+            return set()
+        size = self.database["patient-cohort"].find_one_and_update(
             {"_id": ObjectId(cohort_id)},
+            {"$inc": {"membership_size": len(patient_ids)}},
+            projection={"membership_size"},
+            return_document=pymongo.ReturnDocument.AFTER,
+        )["membership_size"]
+        added = set(patient_ids)
+        try:
+            self.database["patient-cohort-membership"].insert_many(
+                [
+                    {
+                        "_id": _membership_id(cohort_id, patient_id),
+                        "cohort_id": ObjectId(cohort_id),
+                        "patient_id": patient_id,
+                        "position": size - len(patient_ids) + position,
+                    }
+                    for position, patient_id in enumerate(patient_ids)
+                ],
+                ordered=False,
+            )
+        except pymongo.errors.BulkWriteError as error:
+            errors = error.details["writeErrors"]
+            if any(i["code"] != 11000 for i in errors):
+                raise
+            added -= {patient_ids[i["index"]] for i in errors}
+        return added
+
+    def _delete_members(self, cohort_id: str, patient_ids: list) -> set:
+        """
+        Delete the membership documents of patients in a cohort using the
+        membership collection, returning the patients that were members.
+        Documents are first claimed with a token, so concurrent removals never
+        count the same member twice. The token being an ObjectId, claims older
+        than MEMBERSHIP_CLAIM_TIMEOUT are taken over, and the documents of an
+        interrupted removal stay members until a removal completes.
+        """
+        membership = self.database["patient-cohort-membership"]
+        query = {"_id": {"$in": [_membership_id(cohort_id, i) for i in patient_ids]}}
+        token = ObjectId()
+        expired = ObjectId.from_datetime(
+            token.generation_time - MEMBERSHIP_CLAIM_TIMEOUT
+        )
+        membership.update_many(
             {
-                "$set": {
-                    "number_patients": len(
-                        self.database["patient-cohort"].find_one(
-                            {"_id": ObjectId(cohort_id)}, {"patient_ids"}
-                        )["patient_ids"]
-                    )
-                }
+                **query,
+                "$or": [
+                    {"removing": {"$exists": False}},
+                    {"removing": {"$lt": expired}},
+                ],
             },
+            {"$set": {"removing": token}},
         )
+        query["removing"] = token
+        removed = {doc["patient_id"] for doc in membership.find(query, ["patient_id"])}
+        membership.delete_many(query)
+        return removed
 
-        self._update_max_min_patient_dimensions_in_cohort(cohort_id, patient_ids)
+    def _write_memberships(
+        self, cohort_id: ObjectId, patient_ids: list, chunk_size: int
+    ) -> None:
+        """
+        Insert the membership documents of a cohort's members in chunks,
+        skipping the ones already inserted (e.g. by an interrupted run).
+        """
+        for start in range(0, len(patient_ids), chunk_size):
+            try:
+                self.database["patient-cohort-membership"].insert_many(
+                    [
+                        {
+                            "_id": _membership_id(cohort_id, patient_id),
+                            "cohort_id": cohort_id,
+                            "patient_id": patient_id,
+                            "position": position,
+                        }
+                        for position, patient_id in enumerate(
+                            patient_ids[start : start + chunk_size], start
+                        )
+                    ],
+                    ordered=False,
+                )
+            except pymongo.errors.BulkWriteError as error:
+                if any(i["code"] != 11000 for i in error.details["writeErrors"]):
+                    raise
 
-        return self.database["patient-cohort"].find_one(
-            {"_id": ObjectId(cohort_id)}, {"patient_ids"}
-        )["patient_ids"]
+    def migrate_cohort_membership(
+        self, cohort_id: str = None, chunk_size: int = 1000
+    ) -> int:
+        """
+        Function to move the patient_ids array of patient cohorts to the
+        patient-cohort-membership collection (one document per member), for
+        cohorts too large to keep their members in a single document.
+        The DBOps cohort tools work the same with both layouts. Migrating a
+        cohort again is a no-op, and an interrupted migration can be rerun.
+        Cohorts must not be modified while they are migrated.
 
-    def _update_max_min_patient_dimensions_in_cohort(
-        self, cohort_id: str, patient_ids: list
-    ) -> None:
+        Args
+        ------
+            cohort_id:  Patient cohort objectID, all the cohorts if None
+            chunk_size: Number of membership documents inserted per round trip
 
-        cohort_doc = self.database["patient-cohort"].find_one(
-            {"_id": ObjectId(cohort_id)}, {"weight", "height"}
+        Return
+        ------
+            Number of cohorts migrated
+        """
+        query = {"membership": {"$ne": MEMBERSHIP_COLLECTION}}
+        if cohort_id is not None:
+            query["_id"] = ObjectId(cohort_id)
+        migrated = 0
+        for cohort in list(
+            self.database["patient-cohort"].find(query, ["patient_ids"])
+        ):
+            patient_ids = list(dict.fromkeys(cohort.get("patient_ids", [])))
+            self._write_memberships(cohort["_id"], patient_ids, chunk_size)
+            self.database["patient-cohort"].update_one(
+                {"_id": cohort["_id"], **query},
+                {
+                    "$set": {
+                        "membership": MEMBERSHIP_COLLECTION,
+                        "membership_size": len(patient_ids),
+                    },
+                    "$unset": {"patient_ids": ""},
+                },
+            )
+            migrated += 1
+        return migrated
+
+    def cohort_union(
+        self, cohort_ids: list, cohort_name: str = None
+    ) -> Union[list, dict]:
+        """
+        Function to compute the patients belonging to any of several cohorts.
+
+        Args
+        ------
+            cohort_ids: Patient cohort objectIDs
+            cohort_name: Name of a new cohort to store the result in, if set
+
+        Return
+        ------
+            Patients ObjectIDs, or the new patient cohort document
+        """
+        return self._cohort_set_operation("union", cohort_ids, cohort_name)
+
+    def cohort_intersection(
+        self, cohort_ids: list, cohort_name: str = None
+    ) -> Union[list, dict]:
+        """
+        Function to compute the patients belonging to all of several cohorts.
+
+        Args
+        ------
+            cohort_ids: Patient cohort objectIDs
+            cohort_name: Name of a new cohort to store the result in, if set
+
+        Return
+        ------
+            Patients ObjectIDs, or the new patient cohort document
+        """
+        return self._cohort_set_operation("intersection", cohort_ids, cohort_name)
+
+    def cohort_difference(
+        self, cohort_id: str, other_cohort_ids: list, cohort_name: str = None
+    ) -> Union[list, dict]:
+        """
+        Function to compute the patients of a cohort belonging to none of
+        several other cohorts (e.g. "Pulsify ED Patients" minus
+        "Pulsify ES/ED Patients").
+
+        Args
+        ------
+            cohort_id: Patient cohort objectID
+            other_cohort_ids: Patient cohort objectIDs to subtract
+            cohort_name: Name of a new cohort to store the result in, if set
+
+        Return
+        ------
+            Patients ObjectIDs, or the new patient cohort document
+        """
+        return self._cohort_set_operation(
+            "difference", [cohort_id, *other_cohort_ids], cohort_name
         )
-        for id_ in patient_ids:
-            patient_doc = self.database.patient.find_one(
-                {"_id": ObjectId(id_)}, {"weight", "height"}
+
+    def _cohort_set_operation(
+        self, operation: str, cohort_ids: list, cohort_name: str = None
+    ) -> Union[list, dict]:
+        """
+        Members resulting from a set operation over cohorts, computed by the
+        server when the cohorts share a membership layout: set operators over
+        the patient_ids arrays, or a $group per patient over the membership
+        collection. Only the result is sent to the client. The first cohort of a
+        difference is kept even when it is also subtracted.
+        """
+        cohort_ids = [str(i) for i in cohort_ids]
+        if operation == "difference":
+            cohort_ids = cohort_ids[:1] + list(dict.fromkeys(cohort_ids[1:]))
+        else:
+            cohort_ids = list(dict.fromkeys(cohort_ids))
+        cohort_ids = [ObjectId(i) for i in cohort_ids]
+        layouts = {
+            doc["_id"]: doc.get("membership")
+            for doc in self.database["patient-cohort"].find(
+                {"_id": {"$in": cohort_ids}}, ["membership"]
             )
-            for i in ["height", "weight"]:
-                if (
-                    cohort_doc[i]["min"] is not None
-                    and patient_doc[i] is not None
-                    and patient_doc[i] < cohort_doc[i]["min"]
-                ):
-                    cohort_doc[i]["min"] = patient_doc[i]
-                elif (
-                    cohort_doc[i]["max"] is not None
-                    and patient_doc[i] is not None
-                    and patient_doc[i] > cohort_doc[i]["max"]
-                ):
-                    cohort_doc[i]["max"] = patient_doc[i]
-                elif (
-                    cohort_doc[i]["min"] is None
-                    and cohort_doc[i]["max"] is None
-                    and patient_doc[i] is not None
-                ):
-                    cohort_doc[i]["min"] = patient_doc[i]
-                    cohort_doc[i]["max"] = patient_doc[i]
+        }
+        if len(layouts) != len(set(cohort_ids)):
+            raise SystemExit("Patient cohort not found.")
 
-        self.database["patient-cohort"].update_one(
-            {"_id": ObjectId(cohort_id)},
+        if set(layouts.values()) == {MEMBERSHIP_COLLECTION}:
+            patient_ids = self._membership_set_operation(operation, cohort_ids)
+        elif MEMBERSHIP_COLLECTION not in layouts.values():
+            patient_ids = self._array_set_operation(operation, cohort_ids)
+        else:
+            # mixed layouts: combine the member lists client-side
+            members = [self._cohort_members(self._find_cohort(i)) for i in cohort_ids]
+            others = [set(i) for i in members[1:]]
+            if operation == "union":
+                patient_ids = list(dict.fromkeys(i for m in members for i in m))
+            elif operation == "intersection":
+                patient_ids = [
+                    i
+                    for i in dict.fromkeys(members[0])
+                    if all(i in other for other in others)
+                ]
+            else:
+                patient_ids = [
+                    i
+                    for i in dict.fromkeys(members[0])
+                    if not any(i in other for other in others)
+                ]
+
+        if cohort_name is None:
+            return patient_ids
+        return self._create_derived_cohort(
+            cohort_name, operation, cohort_ids, patient_ids
+        )
+
+    def _array_set_operation(self, operation: str, cohort_ids: list) -> list:
+        """
+        Set operation over the patient_ids arrays of cohorts, in one aggregation.
+        """
+        arrays = ["$c" + str(index) for index in range(len(cohort_ids))]
+        if operation == "difference":
+            result = {"$setDifference": [arrays[0], {"$setUnion": arrays[1:]}]}
+        else:
+            result = {"$set" + operation.capitalize(): arrays}
+        result = self.database["patient-cohort"].aggregate(
+            [
+                {"$match": {"_id": {"$in": cohort_ids}}},
+                {
+                    "$group": {
+                        "_id": None,
+                        **{
+                            array[1:]: {
+                                "$max": {
+                                    "$cond": [
+                                        {"$eq": ["$_id", cohort_id]},
+                                        {"$ifNull": ["$patient_ids", []]},
+                                        None,
+                                    ]
+                                }
+                            }
+                            for array, cohort_id in zip(arrays, cohort_ids)
+                        },
+                    }
+                },
+                {"$project": {"_id": 0, "patient_ids": result}},
+            ]
+        )
+        return list(result)[0]["patient_ids"]
+
+    def _membership_set_operation(self, operation: str, cohort_ids: list) -> list:
+        """
+        Set operation over cohorts using the membership collection, grouping
+        the membership documents per patient in one streamed aggregation.
+        """
+        keep = {
+            "union": {},
+            "intersection": {"cohorts": {"$size": len(cohort_ids)}},
+            "difference": {
+                "$and": [
+                    {"cohorts": cohort_ids[0]},
+                    {"cohorts": {"$nin": cohort_ids[1:]}},
+                ]
+            },
+        }[operation]
+        with self.database["patient-cohort-membership"].aggregate(
+            [
+                {"$match": {"cohort_id": {"$in": cohort_ids}}},
+                {
+                    "$group": {
+                        "_id": "$patient_id",
+                        "cohorts": {"$addToSet": "$cohort_id"},
+                        "position": {"$min": "$position"},
+                    }
+                },
+                {"$match": keep},
+                {"$sort": {"position": pymongo.ASCENDING}},
+                {"$project": {"_id": 1}},
+            ],
+            allowDiskUse=True,
+        ) as cursor:
+            return [doc["_id"] for doc in cursor]
+
+    def _create_derived_cohort(
+        self, cohort_name: str, operation: str, cohort_ids: list, patient_ids: list
+    ) -> dict:
+        """
+        Insert a cohort holding the result of a set operation and compute its
+        number of patients, bounds and statistics server-side. Results larger
+        than EMBEDDED_MEMBERS_LIMIT use the membership collection.
+        """
+        cohort = {
+            "cohort_name": cohort_name,
+            "number_patients": 0,
+            "patient_ids": patient_ids,
+            **{dim: {"min": None, "max": None} for dim in COHORT_DIMENSIONS},
+            "derived_from": {
+                "operation": operation,
+                "cohort_ids": [str(i) for i in cohort_ids],
+            },
+            "datetime_creation": datetime.datetime.utcnow(),
+        }
+        membership = len(patient_ids) > EMBEDDED_MEMBERS_LIMIT
+        if membership:
+            del cohort["patient_ids"]
+            cohort["membership"] = MEMBERSHIP_COLLECTION
+            cohort["membership_size"] = len(patient_ids)
+        cohort_id = self.database["patient-cohort"].insert_one(cohort).inserted_id
+        if membership:
+            self._write_memberships(cohort_id, patient_ids, 1000)
+        self._rebuild_cohorts([cohort_id])
+        return self.get_patient_cohort(cohort_id=str(cohort_id))
+
+    def rebuild_all_cohort_stats(self) -> dict:
+        """
+        Function to recompute number_patients, the height/weight bounds and the
+        statistics of every patient cohort from their members, in a single
+        aggregation pass over the cohorts (plus one over the membership
+        collection) applied with one bulk write.
+
+        Return
+        ------
+            Dict with the number of cohorts rebuilt and of cohorts modified
+        """
+        return self._rebuild_cohorts()
+
+    def _rebuild_cohorts(
+        self, cohort_ids: list = None, unchanged: bool = False
+    ) -> dict:
+        """
+        Recompute number_patients, bounds and statistics of the cohorts of
+        cohort_ids (every cohort if None), see rebuild_all_cohort_stats. If
+        unchanged is set, a cohort is only written if its members did not change
+        while they were aggregated (same membership_version and number_patients).
+        """
+        versions = None
+        if unchanged:
+            query = {}
+            if cohort_ids is not None:
+                query = {"_id": {"$in": [ObjectId(i) for i in cohort_ids]}}
+            versions = {
+                doc["_id"]: doc.get("membership_version")
+                for doc in self.database["patient-cohort"].find(
+                    query, ["membership_version"]
+                )
+            }
+        requests = {}
+        for collection, membership in [
+            ("patient-cohort", False),
+            ("patient-cohort-membership", True),
+        ]:
+            with self.database[collection].aggregate(
+                _cohort_rebuild_pipeline(membership, cohort_ids), allowDiskUse=True
+            ) as cursor:
+                for doc in cursor:
+                    if versions is None or doc["_id"] in versions:
+                        requests[doc["_id"]] = self._rebuild_request(doc, versions)
+        if not requests:
+            return {"cohorts": 0, "modified": 0}
+        result = self.database["patient-cohort"].bulk_write(
+            list(requests.values()), ordered=False
+        )
+        return {"cohorts": len(requests), "modified": result.modified_count}
+
+    @staticmethod
+    def _rebuild_request(doc: dict, versions: dict = None) -> pymongo.UpdateOne:
+        """
+        Cohort update applying a document of _cohort_rebuild_pipeline, only if
+        the cohort has the membership_version of versions and the aggregated
+        number_patients when versions is given.
+        """
+        stats = {
+            field: {
+                key: doc[field + "_" + key]
+                for key in ("count", "sum", "sumsq", "min", "max", "hist")
+            }
+            for field in COHORT_STATISTICS
+        }
+        query = {"_id": doc["_id"]}
+        if versions is not None:
+            query["number_patients"] = doc["number_patients"]
+            query["membership_version"] = versions[doc["_id"]]
+        return pymongo.UpdateOne(
+            query,
             {
                 "$set": {
-                    "height.min": cohort_doc["height"]["min"],
-                    "height.max": cohort_doc["height"]["max"],
-                    "weight.min": cohort_doc["weight"]["min"],
-                    "weight.max": cohort_doc["weight"]["max"],
+                    "number_patients": doc["number_patients"],
+                    "stats": stats,
+                    **_set_bounds(
+                        {
+                            dim: (stats[dim]["min"], stats[dim]["max"])
+                            for dim in COHORT_DIMENSIONS
+                        }
+                    ),
                 }
             },
         )
 
     def set_max_min_patient_dimensions_in_cohort(self, cohort_id: str) -> dict:
         """
-        Function to set the max and min patients' dimensions in a patient cohort.
+        Function to set the max and min patients' dimensions in a patient cohort,
+        recomputed from its current members with a single aggregation.
 
         Args
         ------
@@ -257,52 +1898,72 @@ class DBOps:
             Patient cohort document
         """
 
-        cohort_doc = self.database["patient-cohort"].find_one(
-            {"_id": ObjectId(cohort_id)}, {"weight", "height", "patient_ids"}
+        return self._recompute_bounds(
+            cohort_id, {dim: dim for dim in COHORT_DIMENSIONS}
         )
-        for id_ in cohort_doc["patient_ids"]:
-            patient_doc = self.database.patient.find_one(
-                {"_id": ObjectId(id_)}, {"weight", "height"}
-            )
-            for i in ["height", "weight"]:
-                if (
-                    cohort_doc[i]["min"] is not None
-                    and patient_doc[i] is not None
-                    and patient_doc[i] < cohort_doc[i]["min"]
-                ):
-                    cohort_doc[i]["min"] = patient_doc[i]
-                elif (
-                    cohort_doc[i]["max"] is not None
-                    and patient_doc[i] is not None
-                    and patient_doc[i] > cohort_doc[i]["max"]
-                ):
-                    cohort_doc[i]["max"] = patient_doc[i]
-                elif (
-                    cohort_doc[i]["min"] is None
-                    and cohort_doc[i]["max"] is None
-                    and patient_doc[i] is not None
-                ):
-                    cohort_doc[i]["min"] = patient_doc[i]
-                    cohort_doc[i]["max"] = patient_doc[i]
 
-        self.database["patient-cohort"].update_one(
+    def _recompute_bounds(self, cohort_id: str, bounds: dict) -> dict:
+        """
+        Recompute cohort min/max bounds from the current members and return the
+        updated cohort document.
+
+        Args
+        ------
+            cohort_id:  Patient cohort objectID
+            bounds: Cohort path holding the min/max -> patient field
+        """
+        cohort = self._find_cohort(cohort_id, ["membership"])
+        return self.database["patient-cohort"].find_one_and_update(
             {"_id": ObjectId(cohort_id)},
-            {
-                "$set": {
-                    "height.min": cohort_doc["height"]["min"],
-                    "height.max": cohort_doc["height"]["max"],
-                    "weight.min": cohort_doc["weight"]["min"],
-                    "weight.max": cohort_doc["weight"]["max"],
-                }
-            },
+            {"$set": _set_bounds(self._member_bounds(cohort, bounds))},
+            return_document=pymongo.ReturnDocument.AFTER,
         )
 
-        return self.database["patient-cohort"].find_one({"_id": ObjectId(cohort_id)})
+    def _member_bounds(self, cohort: dict, bounds: dict) -> dict:
+        """
+        (min, max) of patient fields over the members of a cohort document,
+        computed server-side in one aggregation joining the members' patient
+        documents. Missing patients are ignored.
+
+        Args
+        ------
+            cohort: Cohort document with its _id and membership layout
+            bounds: Cohort path holding the min/max -> patient field
+        """
+        membership = cohort.get("membership") == MEMBERSHIP_COLLECTION
+        fields = list(bounds.items())
+        collection = "patient-cohort-membership" if membership else "patient-cohort"
+        with self.database[collection].aggregate(
+            _member_stages(membership, [cohort["_id"]])
+            + [
+                {
+                    "$group": {
+                        "_id": None,
+                        **{
+                            op + str(index): {"$" + op: "$_patient." + field}
+                            for index, (_, field) in enumerate(fields)
+                            for op in ("min", "max")
+                        },
+                    }
+                }
+            ],
+            allowDiskUse=True,
+        ) as cursor:
+            groups = list(cursor)
+        return {
+            path: (
+                (groups[0]["min" + str(index)], groups[0]["max" + str(index)])
+                if groups
+                else (None, None)
+            )
+            for index, (path, _) in enumerate(fields)
+        }
 
     def update_human_demographics(self, internal_id: int, **kwargs) -> None:
-        # pylint: disable=too-many-branches
         """
         Function to update a patients' demographic info.
+        Every value is validated before the patient documents are updated, in a
+        single update computing their bmi and bsa server-side.
 
         Args
         ------
@@ -317,79 +1978,206 @@ class DBOps:
             loc (str) : Human origin_location
         """
 
-        age, gender, height, weight, origin_location = [
-            kwargs.get("age"),
-            kwargs.get("gender"),
-            kwargs.get("height"),
-            kwargs.get("weight"),
-            kwargs.get("loc"),
-        ]
-        if not isinstance(age, (int, float)) and age is not None:
-            raise ValueError("Age must be an integer or float.")
-        if age not in range(0, 121) and age is not None:
-            raise ValueError("Age not inside the valid range.")
-        if age:
+        pipeline = _demographics_update(_validate_demographics(**kwargs))
+        if pipeline:
             self.database.patient.update_many(
-                {"internal_info.internal_id": internal_id}, {"$set": {"age": age}}
+                {"internal_info.internal_id": internal_id}, pipeline
             )
-        if gender not in ["male", "female"] and gender is not None:
-            raise ValueError("Gender not male/female.")
-        if gender:
-            self.database.patient.update_many(
-                {"internal_info.internal_id": internal_id}, {"$set": {"gender": gender}}
-            )
-        for i in [height, weight]:
-            if not isinstance(i, (int, float)) and i is not None:
-                raise ValueError("Height/weight must be an integer or float.")
-        if height:
-            self.database.patient.update_many(
-                {"internal_info.internal_id": internal_id}, {"$set": {"height": height}}
+        self._invalidate_patient(internal_id)
+
+    def update_demographics_bulk(
+        self,
+        rows: Union[str, list],
+        chunk_size: int = 500,
+        refresh_cohorts: bool = False,
+    ) -> dict:
+        """
+        Function to update the demographic info of many patients, e.g. from a
+        spreadsheet of corrections. Rows are validated like
+        update_human_demographics and applied with one unordered bulk write per
+        chunk_size rows.
+
+        Args
+        ------
+            rows: Iterable of dicts with an internal_id and update_human_demographics
+                kwargs, or the path to a csv file with those columns
+            chunk_size: Number of rows per bulk write
+            refresh_cohorts: Recompute the bounds and statistics of the cohorts
+                holding an updated patient
+
+        Return
+        ------
+            Dict with the result of every row in input order ({"row", "internal_id",
+            "status": updated/unchanged/invalid/not_found/failed, "error"}) and the
+            number of cohorts refreshed
+        """
+        if isinstance(rows, str):
+            rows = csv2dicts(rows)
+        report, chunk, updated = [], [], set()
+        for index, row in enumerate(rows):
+            fields = dict(row)
+            result = {"row": index, "internal_id": fields.pop("internal_id", None)}
+            report.append(result)
+            try:
+                if not isinstance(result["internal_id"], int):
+                    raise ValueError("internal_id must be an integer.")
+                pipeline = _demographics_update(_validate_demographics(**fields))
+            except ValueError as error:
+                result.update(status="invalid", error=str(error))
+                continue
+            if not pipeline:
+                result["status"] = "unchanged"
+                continue
+            chunk.append((result, pipeline))
+            if len(chunk) >= chunk_size:
+                updated |= self._write_demographics(chunk)
+                chunk = []
+        if chunk:
+            updated |= self._write_demographics(chunk)
+        cohorts = 0
+        if refresh_cohorts and updated:
+            cohort_ids = {
+                cohort["_id"]
+                for cohort_list in self.get_cohorts_for_patients(
+                    list(updated), ["_id"]
+                ).values()
+                for cohort in cohort_list
+            }
+            if cohort_ids:
+                cohorts = self._rebuild_cohorts(list(cohort_ids))["cohorts"]
+        return {"rows": report, "cohorts": cohorts}
+
+    def _write_demographics(self, chunk: list) -> set:
+        """
+        Apply a chunk of update_demographics_bulk (row result, pipeline update)
+        pairs in one unordered bulk write, filling in the row results, and
+        return the ObjectIDs (str) of the patient documents updated.
+        """
+        internal_ids = list({result["internal_id"] for result, _ in chunk})
+        patients = {}
+        for doc in self.database.patient.find(
+            {"internal_info.internal_id": {"$in": internal_ids}},
+            {"internal_info.internal_id": 1},
+        ):
+            patients.setdefault(doc["internal_info"]["internal_id"], []).append(
+                str(doc["_id"])
             )
-            check_weight = self.database.patient.find_one(
-                {"internal_info.internal_id": internal_id}, {"weight"}
-            )["weight"]
-            if check_weight is not None:
-                bmi = calculate_bmi(check_weight, height)
-                bsa = calculate_mosteller_bsa(check_weight, height)
-                self.database.patient.update_many(
-                    {"internal_info.internal_id": internal_id}, {"$set": {"bmi": bmi}}
+        writes = []
+        for result, pipeline in chunk:
+            if result["internal_id"] not in patients:
+                result.update(status="not_found", error="Patient not found.")
+                continue
+            result["status"] = "updated"
+            writes.append(
+                (
+                    result,
+                    pymongo.UpdateMany(
+                        {"internal_info.internal_id": result["internal_id"]}, pipeline
+                    ),
                 )
-                self.database.patient.update_many(
-                    {"internal_info.internal_id": internal_id}, {"$set": {"bsa": bsa}}
-                )
-        if weight:
-            self.database.patient.update_many(
-                {"internal_info.internal_id": internal_id}, {"$set": {"weight": weight}}
             )
-            check_height = self.database.patient.find_one(
-                {"internal_info.internal_id": internal_id}, {"height"}
-            )["height"]
-            if check_height is not None:
-                bmi = calculate_bmi(weight, check_height)
-                bsa = calculate_mosteller_bsa(weight, check_height)
-                self.database.patient.update_many(
-                    {"internal_info.internal_id": internal_id}, {"$set": {"bmi": bmi}}
-                )
-                self.database.patient.update_many(
-                    {"internal_info.internal_id": internal_id}, {"$set": {"bsa": bsa}}
+        if not writes:
+            return set()
+        try:
+            self.database.patient.bulk_write(
+                [request for _, request in writes], ordered=False
+            )
+        except pymongo.errors.BulkWriteError as error:
+            for write_error in error.details["writeErrors"]:
+                writes[write_error["index"]][0].update(
+                    status="failed", error=write_error["errmsg"]
                 )
+        updated = set()
+        for result, _ in writes:
+            self._invalidate_patient(result["internal_id"])
+            if result["status"] == "updated":
+                updated.update(patients[result["internal_id"]])
+        return updated
+
+    def backfill_bmi_bsa(self, batch_size: int = 1000, dry_run: bool = False) -> dict:
+        """
+        Function to recompute the bmi and bsa of every patient from its height and
+        weight, e.g. after manual fixes or a change of rounding. Patients are
+        streamed batch_size at a time and only the documents whose values change
+        are written, with one unordered bulk write per batch. Run
+        rebuild_all_cohort_stats afterwards to refresh the cohort statistics.
 
-        if (
-            origin_location
-            not in [
-                "europe",
-                "asia_pacific",
-                "north_south_america",
-                "middle_east_africa",
-            ]
-            and origin_location is not None
-        ):
-            raise ValueError("Origin location not in the accepted values/format.")
-        if origin_location:
-            self.database.patient.update_many(
-                {"internal_info.internal_id": internal_id},
-                {"$set": {"origin_location": origin_location}},
+        Args
+        ------
+            batch_size: Number of patients fetched and written per round trip
+            dry_run: Only count the documents which would change
+
+        Return
+        ------
+            Dict with the number of patients scanned, modified and skipped
+            (non-numeric or non-positive height/weight), the elapsed seconds and
+            the patients scanned per second
+        """
+        report = {"scanned": 0, "modified": 0, "skipped": 0}
+        start = time.perf_counter()
+        cursor = self.database.patient.find(
+            {}, {"height": 1, "weight": 1, "bmi": 1, "bsa": 1}, batch_size=batch_size
+        )
+        with cursor:
+            batch = []
+            for doc in cursor:
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    self._backfill_batch(batch, report, dry_run)
+                    batch = []
+            if batch:
+                self._backfill_batch(batch, report, dry_run)
+        if report["modified"] and not dry_run and self.cache is not None:
+            self.cache.invalidate_where(lambda key: key[0] == "patient")
+        report["seconds"] = time.perf_counter() - start
+        report["per_second"] = (
+            report["scanned"] / report["seconds"] if report["seconds"] else 0.0
+        )
+        return report
+
+    def _backfill_batch(self, batch: list, report: dict, dry_run: bool) -> None:
+        """
+        Recompute the bmi/bsa of a batch of backfill_bmi_bsa patient documents
+        with the array versions of calculate_bmi/calculate_mosteller_bsa, write
+        the changed ones and update the report counters.
+        """
+        valid = [
+            doc
+            for doc in batch
+            if all(
+                doc.get(field) is None
+                or isinstance(doc[field], (int, float))
+                and doc[field] > 0
+                for field in ("weight", "height")
             )
+        ]
+        report["skipped"] += len(batch) - len(valid)
+        weights = [doc.get("weight") for doc in valid]
+        heights = [doc.get("height") for doc in valid]
+        indices = {
+            "bmi": calculate_bmi(weights, heights),
+            "bsa": calculate_mosteller_bsa(weights, heights),
+        }
+        requests = []
+        for index, doc in enumerate(valid):
+            values = {
+                field: None if math.isnan(value[index]) else float(value[index])
+                for field, value in indices.items()
+            }
+            if any(doc.get(field) != value for field, value in values.items()):
+                # skipped if the height/weight changed since they were read
+                query = {
+                    "_id": doc["_id"],
+                    "height": doc.get("height"),
+                    "weight": doc.get("weight"),
+                }
+                requests.append(pymongo.UpdateOne(query, {"$set": values}))
+        report["scanned"] += len(batch)
+        if requests and not dry_run:
+            result = self.database.patient.bulk_write(requests, ordered=False)
+            report["modified"] += result.modified_count
+        else:
+            report["modified"] += len(requests)
 
     def get_patient_model_list(
         self, internal_id: int, series: Union[str, list] = None
@@ -406,7 +2194,9 @@ class DBOps:
         ------
             Patient model list
         """
-        return self.get_patient_model_collection(internal_id, series)["models"]
+        return self.get_patient_model_collection(
+            internal_id, series, fields=["models"]
+        )["models"]
 
     def update_patient_model_list(
         self, internal_id: int, models: list, series: Union[str, list] = None
@@ -425,10 +2215,11 @@ class DBOps:
             Patient's models collection document
         """
 
-        query = self.get_patient_collection(internal_id, series)[0]
+        query = self.get_patient_collection(internal_id, series, fields=["models"])[0]
         self.database.models.find_one_and_update(
             {"_id": ObjectId(query["models"])}, {"$set": {"models": models}}
         )
+        self._invalidate_models(query["models"])
         return self.database.models.find_one({"_id": ObjectId(query["models"])})
 
     def append_blobs_to_submodel(
@@ -453,15 +2244,16 @@ class DBOps:
             Patient's models collection document
         """
 
-        query = self.get_patient_collection(internal_id, series)
+        query = self.get_patient_collection(internal_id, series, fields=["models"])
         models_id = ObjectId(query[0]["models"])
-        model_dict = self.database.models.find_one({"_id": models_id})
+        model_dict = self.database.models.find_one({"_id": models_id}, {"models"})
         for idx, i in enumerate(model_dict["models"]):
             if i["timestamp"] == timestamp:
                 model_dict["models"][idx]["sub_models"].extend(blobs)
         self.database.models.find_one_and_update(
             {"_id": models_id}, {"$set": {"models": model_dict["models"]}}
         )
+        self._invalidate_models(models_id)
         return self.database.models.find_one({"_id": models_id})
 
     # pylint: disable=too-many-arguments
@@ -497,9 +2289,9 @@ class DBOps:
             "type_of_spline": type_of_spline,
         }
 
-        query = self.get_patient_collection(internal_id, series)
+        query = self.get_patient_collection(internal_id, series, fields=["models"])
         models_id = ObjectId(query[0]["models"])
-        model_dict = self.database.models.find_one({"_id": models_id})
+        model_dict = self.database.models.find_one({"_id": models_id}, {"models"})
         for i in model_dict["models"]:
             if i["timestamp"] == timestamp:
                 i["landmarks"].append(landmarks)
@@ -507,6 +2299,7 @@ class DBOps:
         self.database.models.find_one_and_update(
             {"_id": models_id}, {"$set": {"models": model_dict["models"]}}
         )
+        self._invalidate_models(models_id)
 
         return self.database.models.find_one({"_id": models_id})
 
@@ -585,7 +2378,7 @@ class DBOps:
         for patient in patients_list:
             human = next(iter(patient))
             series = patient[human]
-            if self.get_patient_collection(human, series):
+            if self.get_patient_collection(human, series, fields=["_id"]):
                 raise SystemExit(patient, "Patient already present in the database.")
 
             if internal_id_list:
@@ -628,7 +2421,7 @@ class DBOps:
         for patient in patients_list:
             human = next(iter(patient))
             series = patient[human]
-            if not self.get_patient_collection(human, series):
+            if not self.get_patient_collection(human, series, fields=["_id"]):
                 if internal_id_list:
                     with open(
                         os.path.join(
@@ -672,6 +2465,7 @@ class DBOps:
                         pat_dict["datetime_creation"] = now
                 pat_dict["models"] = str(model_id)
                 patient_id = self.database.patient.insert_one(pat_dict).inserted_id
+                self._invalidate_patient(human)
                 pat_ids.append(str(patient_id))
             else:
                 raise SystemExit("Patient already present in the database.")
@@ -733,18 +2527,45 @@ class DBOps:
         else:
             pat_ids = self.upload_patients(jsondir, patients_list=patients_list)
         self.add_patients_to_cohort(cohort_id, pat_ids)
-        return self.database["patient-cohort"].find_one({"_id": ObjectId(cohort_id)})
+        return self.get_patient_cohort(cohort_id=cohort_id)
 
-    def get_all_patients_patientcoll(self) -> dict:
+    def get_all_patients_patientcoll(self, batch_size: int = 1000) -> dict:
         """
         Function to retrieve all patients inside patient collection.
+
+        Args
+        ------
+            batch_size: Number of patients fetched per round trip
+
+        Return
+        ------
+            Dict of internal_id -> series sorted by internal_id, the latest
+            document winning for internal_ids with several series
         """
+        return dict(self.iter_all_patients_patientcoll(batch_size))
 
-        docs = list(self.database.patient.find())
-        patients = {}
-        for i in docs:
-            if "internal_info" in i.keys():
-                patients[i["internal_info"]["internal_id"]] = i["internal_info"][
+    def iter_all_patients_patientcoll(self, batch_size: int = 1000):
+        """
+        Generator over the (internal_id, series) of every patient inside patient
+        collection, in internal_id then insertion order. Only internal_info is
+        fetched and documents are streamed batch_size at a time.
+
+        Args
+        ------
+            batch_size: Number of patients fetched per round trip
+
+        Yield
+        ------
+            (internal_id, series) tuples
+        """
+        cursor = self.database.patient.find(
+            {"internal_info": {"$exists": True}},
+            {"_id": 0, "internal_info.internal_id": 1, "internal_info.series": 1},
+            sort=PATIENT_LISTING_ORDER,
+            batch_size=batch_size,
+        )
+        with cursor:
+            for doc in cursor:
+                yield doc["internal_info"]["internal_id"], doc["internal_info"].get(
                     "series"
-                ]
-        return dict(sorted(patients.items()))
+                )
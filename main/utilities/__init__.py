@@ -2,6 +2,10 @@
 Utilities module
 """
 
+from . import cache
+from . import clients
+from . import local_db
+from . import local_query
 from . import utils
 
-__all__ = ["utils"]
+__all__ = ["cache", "clients", "local_db", "local_query", "utils"]
@@ -0,0 +1,105 @@
+"""
+In-process document cache.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class DocumentCache:
+    """
+    Thread-safe LRU cache of database documents with an optional time to live.
+    Documents are copied in and out, so callers may modify what they receive.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None) -> None:
+        """
+        Args
+        ------
+            maxsize: Maximum number of cached entries
+            ttl: Seconds an entry stays valid, None for no expiry
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        """
+        Function to return a copy of the cached value of a key, None on a miss.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            self.misses += 1
+        return None
+
+    def put(self, key: Hashable, value) -> None:
+        """
+        Function to cache a copy of a value. Empty values are not cached, so
+        documents inserted later are found.
+        """
+        if not value:
+            return
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, load: Callable):
+        """
+        Function to return the cached value of a key, calling load() on a miss.
+        """
+        value = self.get(key)
+        if value is None:
+            value = load()
+            self.put(key, value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Function to drop a key from the cache.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable) -> None:
+        """
+        Function to drop every key for which predicate(key) is true.
+        """
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        """
+        Function to drop every entry, keeping the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def info(self) -> dict:
+        """
+        Function to report the cache counters for tuning.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
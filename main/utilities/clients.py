@@ -0,0 +1,64 @@
+"""
+Process-wide registry of MongoDB clients.
+"""
+
+import os
+import threading
+import pymongo
+
+_CLIENT_OPTIONS = {
+    "max_pool_size": "maxPoolSize",
+    "min_pool_size": "minPoolSize",
+    "max_idle_time_ms": "maxIdleTimeMS",
+    "connect_timeout_ms": "connectTimeoutMS",
+}
+
+_clients = {}
+_clients_pid = os.getpid()
+_lock = threading.Lock()
+
+
+def client_options(env_cfg: dict) -> dict:
+    """
+    Function to translate the connection settings of a config.yaml environment
+    into MongoClient keyword arguments. Unset settings keep pymongo's defaults.
+    """
+    return {
+        option: env_cfg[key]
+        for key, option in _CLIENT_OPTIONS.items()
+        if env_cfg.get(key) is not None
+    }
+
+
+def get_client(env_cfg: dict) -> pymongo.MongoClient:
+    """
+    Function to retrieve the MongoClient of a config.yaml environment.
+    Clients are keyed by connection string and shared by every caller in the
+    process, so the connection pool is only created and warmed up once.
+    The options of the first request for a connection string are the ones used.
+    """
+    global _clients_pid  # pylint: disable=global-statement,invalid-name
+
+    conn_str = env_cfg["conn_str"]
+    with _lock:
+        if _clients_pid != os.getpid():
+            # MongoClient is not fork-safe: a child process builds its own pools.
+            _clients.clear()
+            _clients_pid = os.getpid()
+        client = _clients.get(conn_str)
+        if client is None:
+            client = pymongo.MongoClient(conn_str, **client_options(env_cfg))
+            _clients[conn_str] = client
+        return client
+
+
+def close_all() -> None:
+    """
+    Function to close every registered client, e.g. on process shutdown.
+    Subsequent get_client calls create new clients.
+    """
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
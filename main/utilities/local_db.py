@@ -0,0 +1,606 @@
+"""
+Pure-Python local database backend.
+
+Implements the subset of the pymongo collection API used by DBOps on top of
+in-process dicts, so a seeded database can be restored from a pickled snapshot
+without starting a mongod server.
+"""
+
+import os
+import copy
+import pickle
+import threading
+from typing import Union
+from bson import ObjectId
+from pymongo import InsertOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import (
+    BulkWriteResult,
+    DeleteResult,
+    InsertOneResult,
+    InsertManyResult,
+    UpdateResult,
+)
+from main.utilities.local_query import (
+    apply_update,
+    equal,
+    expand,
+    hashable,
+    is_operator_dict,
+    matches,
+    project,
+    resolve,
+    run_pipeline,
+    sort_docs,
+    sort_spec,
+)
+from main.utilities.utils import TEST_DATA_DIR, add_test_data_to_db
+
+SNAPSHOT_PATH = os.path.join(TEST_DATA_DIR, "local.snapshot.pickle")
+SNAPSHOT_VERSION = 2
+
+_seed_snapshots = {}
+
+
+class _BulkOperations:
+    """
+    Collects the operations of a bulk_write through the bulk interface the
+    pymongo request classes (InsertOne, UpdateOne, ...) add themselves to.
+    """
+
+    def __init__(self) -> None:
+        self.operations = []
+
+    def add_insert(self, document: dict) -> None:
+        """
+        Queue an insert.
+        """
+        self.operations.append(("insert", document))
+
+    def add_update(self, selector, update, multi=False, upsert=False, **_kwargs):
+        """
+        Queue an update.
+        """
+        self.operations.append(("update", selector, update, multi, upsert))
+
+    def add_replace(self, *_args, **_kwargs):
+        """
+        Replacements are not supported.
+        """
+        raise OperationFailure("Unsupported bulk operation replace.")
+
+    def add_delete(self, *_args, **_kwargs):
+        """
+        Deletions are not supported.
+        """
+        raise OperationFailure("Unsupported bulk operation delete.")
+
+
+class LocalCursor:
+    """
+    Cursor over the result of a LocalCollection.find query.
+    """
+
+    def __init__(self, collection, docs: list, projection=None) -> None:
+        self.collection = collection
+        self._docs = docs
+        self._projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None) -> "LocalCursor":
+        """
+        Sort the results by one or several keys.
+        """
+        self._sort = sort_spec(key_or_list, direction)
+        return self
+
+    def skip(self, skip: int) -> "LocalCursor":
+        """
+        Skip the first results.
+        """
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int) -> "LocalCursor":
+        """
+        Limit the number of results, 0 meaning no limit.
+        """
+        self._limit = limit
+        return self
+
+    def batch_size(self, _batch_size: int) -> "LocalCursor":
+        """
+        Accepted for API compatibility, results are already local.
+        """
+        return self
+
+    def close(self) -> None:
+        """
+        Accepted for API compatibility.
+        """
+
+    def __enter__(self) -> "LocalCursor":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __iter__(self):
+        docs = sort_docs(self._docs, self._sort) if self._sort else self._docs
+        docs = docs[self._skip :]
+        if self._limit:
+            docs = docs[: self._limit]
+        for doc in docs:
+            yield project(doc, self._projection)
+
+
+class LocalCollection:
+    """
+    In-process collection keeping documents in a dict keyed by _id,
+    with hash indexes on the fields passed to create_index.
+    """
+
+    def __init__(self, database, name: str) -> None:
+        self.database = database
+        self.name = name
+        self._docs = {}
+        self._seq = {}
+        self._indexes = {}
+        self._index_specs = {}
+
+    def __getstate__(self) -> dict:
+        return {"name": self.name, "docs": self._docs, "indexes": self._index_specs}
+
+    def __setstate__(self, state: dict) -> None:
+        self.database = None
+        self.name = state["name"]
+        self._docs = state["docs"]
+        self._seq = {id_: i for i, id_ in enumerate(self._docs)}
+        self._index_specs = state["indexes"]
+        self._indexes = {spec[0][0]: {} for spec in self._index_specs.values()}
+        for doc in self._docs.values():
+            self._index(doc)
+
+    @property
+    def _lock(self) -> threading.RLock:
+        return self.database.lock
+
+    def _index(self, doc: dict, remove: bool = False) -> None:
+        for path, index in self._indexes.items():
+            keys = {hashable(v) for v in expand(resolve(doc, path.split(".")))}
+            for key in keys or {None}:
+                if remove:
+                    index[key].discard(doc["_id"])
+                    if not index[key]:
+                        del index[key]
+                else:
+                    index.setdefault(key, set()).add(doc["_id"])
+
+    def _candidates(self, query: dict) -> list:
+        """
+        Documents that may match a query, narrowed down by the first equality
+        or $in condition on _id or on an indexed field.
+        """
+        for path, condition in (query or {}).items():
+            if path != "_id" and path not in self._indexes:
+                continue
+            if not is_operator_dict(condition):
+                operands = [condition]
+            elif list(condition) in (["$eq"], ["$in"]):
+                operands = condition.get("$in", [condition.get("$eq")])
+            else:
+                continue
+            ids = set()
+            for operand in operands:
+                if path == "_id":
+                    key = hashable(operand)
+                    if key in self._docs:
+                        ids.add(key)
+                else:
+                    ids.update(self._indexes[path].get(hashable(operand), ()))
+            return [self._docs[id_] for id_ in sorted(ids, key=self._seq.get)]
+        return list(self._docs.values())
+
+    def _find(self, query: dict) -> list:
+        return [doc for doc in self._candidates(query) if matches(doc, query)]
+
+    def create_index(self, keys, **kwargs) -> str:
+        """
+        Create an index, served by a hash index on its first field.
+        """
+        spec = sort_spec(keys, 1)
+        name = kwargs.get("name") or "_".join("{}_{}".format(k, d) for k, d in spec)
+        path = spec[0][0]
+        with self._lock:
+            self._index_specs[name] = spec
+            if path not in self._indexes:
+                self._indexes[path] = {}
+                for doc in self._docs.values():
+                    self._index(doc)
+        return name
+
+    def index_information(self) -> dict:
+        """
+        Indexes of the collection by name.
+        """
+        info = {"_id_": {"key": [("_id", 1)]}}
+        for name, spec in self._index_specs.items():
+            info[name] = {"key": spec}
+        return info
+
+    def find(self, filter=None, projection=None, **kwargs) -> LocalCursor:
+        # pylint: disable=redefined-builtin
+        """
+        Query the collection.
+        """
+        with self._lock:
+            cursor = LocalCursor(self, self._find(filter), projection)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        return cursor.skip(kwargs.get("skip", 0)).limit(kwargs.get("limit", 0))
+
+    def find_one(self, filter=None, projection=None, **kwargs) -> Union[dict, None]:
+        # pylint: disable=redefined-builtin
+        """
+        Query a single document of the collection.
+        """
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        return next(iter(self.find(filter, projection, limit=1, **kwargs)), None)
+
+    def aggregate(self, pipeline: list, **_kwargs) -> LocalCursor:
+        """
+        Run an aggregation pipeline over the collection.
+        """
+        with self._lock:
+            docs = list(self._docs.values())
+            if pipeline and "$match" in pipeline[0]:
+                docs = self._find(pipeline[0]["$match"])
+                pipeline = pipeline[1:]
+            docs = run_pipeline(docs, pipeline, self._lookup)
+            return LocalCursor(self, docs)
+
+    def _lookup(self, name: str, query: dict) -> list:
+        # pylint: disable-next=protected-access
+        return self.database[name]._find(query)
+
+    def _apply(self, doc: dict, update: Union[dict, list]) -> None:
+        """
+        Apply an update document, or an aggregation pipeline update, in place.
+        """
+        if isinstance(update, dict):
+            apply_update(doc, update)
+            return
+        updated = run_pipeline([doc], update, self._lookup)[0]
+        doc.clear()
+        doc.update(updated)
+
+    def estimated_document_count(self, **_kwargs) -> int:
+        """
+        Number of documents in the collection.
+        """
+        return len(self._docs)
+
+    def count_documents(self, filter: dict, **_kwargs) -> int:
+        # pylint: disable=redefined-builtin
+        """
+        Count the documents matching a filter.
+        """
+        with self._lock:
+            return len(self._find(filter))
+
+    def _insert(self, document: dict) -> ObjectId:
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        if document["_id"] in self._docs:
+            raise DuplicateKeyError(
+                "E11000 duplicate key error collection: {} _id: {}".format(
+                    self.name, document["_id"]
+                ),
+                code=11000,
+            )
+        # the server stores _id as the first field
+        doc = copy.deepcopy({"_id": document["_id"], **document})
+        self._docs[doc["_id"]] = doc
+        self._seq[doc["_id"]] = len(self._seq)
+        self._index(doc)
+        return doc["_id"]
+
+    def insert_one(self, document: dict) -> InsertOneResult:
+        """
+        Insert a document, setting its _id if missing.
+        """
+        with self._lock:
+            return InsertOneResult(self._insert(document), True)
+
+    def insert_many(
+        self, documents: list, ordered: bool = True, **_kwargs
+    ) -> InsertManyResult:
+        """
+        Insert several documents, setting their _id if missing.
+        """
+        documents = list(documents)
+        for document in documents:
+            document.setdefault("_id", ObjectId())
+        self.bulk_write([InsertOne(doc) for doc in documents], ordered=ordered)
+        return InsertManyResult([doc["_id"] for doc in documents], True)
+
+    def _delete(self, query: dict, many: bool) -> DeleteResult:
+        with self._lock:
+            docs = self._find(query)
+            if not many:
+                docs = docs[:1]
+            for doc in docs:
+                # _seq keeps the entry so insertion ranks stay increasing
+                self._index(doc, remove=True)
+                del self._docs[doc["_id"]]
+        return DeleteResult({"n": len(docs), "ok": 1.0}, True)
+
+    def delete_one(self, filter: dict, **_kwargs) -> DeleteResult:
+        # pylint: disable=redefined-builtin
+        """
+        Delete the first document matching a filter.
+        """
+        return self._delete(filter, False)
+
+    def delete_many(self, filter: dict, **_kwargs) -> DeleteResult:
+        # pylint: disable=redefined-builtin
+        """
+        Delete every document matching a filter.
+        """
+        return self._delete(filter, True)
+
+    def _update(self, query: dict, update: dict, many: bool, upsert: bool) -> tuple:
+        docs = self._find(query)
+        if not many:
+            docs = docs[:1]
+        modified = 0
+        for doc in docs:
+            before = copy.deepcopy(doc)
+            self._index(doc, remove=True)
+            try:
+                self._apply(doc, update)
+            finally:
+                self._index(doc)
+            modified += not equal(before, doc)
+        upserted_id = None
+        if not docs and upsert:
+            doc = {
+                k: copy.deepcopy(v)
+                for k, v in (query or {}).items()
+                if not k.startswith("$") and not is_operator_dict(v)
+            }
+            if isinstance(update, list):
+                self._apply(doc, update)
+            else:
+                apply_update(
+                    doc, {k: v for k, v in update.items() if k != "$setOnInsert"}
+                )
+                apply_update(doc, {"$set": update.get("$setOnInsert", {})})
+            upserted_id = self._insert(doc)
+            docs = [self._docs[upserted_id]]
+        return docs, modified, upserted_id
+
+    def _update_result(self, query, update, many: bool, upsert: bool) -> UpdateResult:
+        with self._lock:
+            docs, modified, upserted_id = self._update(query, update, many, upsert)
+        raw = {"n": len(docs), "nModified": modified, "ok": 1.0}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    def update_one(self, filter, update, upsert=False, **_kwargs) -> UpdateResult:
+        # pylint: disable=redefined-builtin
+        """
+        Update the first document matching a filter.
+        """
+        return self._update_result(filter, update, False, upsert)
+
+    def update_many(self, filter, update, upsert=False, **_kwargs) -> UpdateResult:
+        # pylint: disable=redefined-builtin
+        """
+        Update every document matching a filter.
+        """
+        return self._update_result(filter, update, True, upsert)
+
+    def bulk_write(self, requests: list, ordered: bool = True, **_kwargs):
+        """
+        Run insert and update requests, stopping at the first error if ordered.
+        """
+        bulk = _BulkOperations()
+        for request in requests:
+            # pylint: disable-next=protected-access
+            request._add_to_bulk(bulk)
+        raw = {
+            "writeErrors": [],
+            "writeConcernErrors": [],
+            "nInserted": 0,
+            "nUpserted": 0,
+            "nMatched": 0,
+            "nModified": 0,
+            "nRemoved": 0,
+            "upserted": [],
+        }
+        with self._lock:
+            for index, (kind, *args) in enumerate(bulk.operations):
+                try:
+                    if kind == "insert":
+                        self._insert(args[0])
+                        raw["nInserted"] += 1
+                        continue
+                    docs, modified, upserted_id = self._update(*args)
+                except (DuplicateKeyError, OperationFailure) as error:
+                    raw["writeErrors"].append(
+                        {
+                            "index": index,
+                            "code": error.code,
+                            "errmsg": str(error),
+                            "op": args[0],
+                        }
+                    )
+                    if ordered:
+                        break
+                    continue
+                if upserted_id is None:
+                    raw["nMatched"] += len(docs)
+                    raw["nModified"] += modified
+                else:
+                    raw["nUpserted"] += 1
+                    raw["upserted"].append({"index": index, "_id": upserted_id})
+        if raw["writeErrors"]:
+            raise BulkWriteError(raw)
+        return BulkWriteResult(raw, True)
+
+    def find_one_and_update(
+        self,
+        filter,
+        update,
+        projection=None,
+        return_document=ReturnDocument.BEFORE,
+        upsert=False,
+        **_kwargs
+    ) -> Union[dict, None]:
+        # pylint: disable=redefined-builtin,too-many-arguments
+        """
+        Update the first document matching a filter and return it.
+        """
+        with self._lock:
+            before = self._find(filter)[:1]
+            before = copy.deepcopy(before[0]) if before else None
+            docs, _, _ = self._update(filter, update, False, upsert)
+            if return_document == ReturnDocument.AFTER:
+                return project(docs[0], projection) if docs else None
+            return project(before, projection) if before is not None else None
+
+
+class LocalDatabase:
+    """
+    In-process database holding LocalCollections by name.
+    """
+
+    def __init__(self, client, name: str) -> None:
+        self.client = client
+        self.name = name
+        self.lock = threading.RLock()
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> LocalCollection:
+        with self.lock:
+            if name not in self._collections:
+                self._collections[name] = LocalCollection(self, name)
+            return self._collections[name]
+
+    def __getattr__(self, name: str) -> LocalCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def list_collection_names(self, **_kwargs) -> list:
+        """
+        Names of the collections holding documents.
+        """
+        return [
+            name
+            for name, coll in self._collections.items()
+            if coll.estimated_document_count()
+        ]
+
+    def snapshot(self) -> bytes:
+        """
+        Serialise every collection with its documents and indexes.
+        """
+        with self.lock:
+            return pickle.dumps(self._collections, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def restore(self, snapshot: bytes) -> None:
+        """
+        Replace the database content with a snapshot.
+        """
+        collections = pickle.loads(snapshot)
+        for collection in collections.values():
+            collection.database = self
+        with self.lock:
+            self._collections = collections
+
+
+class LocalClient:
+    """
+    In-process client, the counterpart of pymongo.MongoClient for LocalDatabases.
+    """
+
+    HOST = "localhost"
+
+    def __init__(self) -> None:
+        self._databases = {}
+
+    def __getitem__(self, name: str) -> LocalDatabase:
+        if name not in self._databases:
+            self._databases[name] = LocalDatabase(self, name)
+        return self._databases[name]
+
+    def __getattr__(self, name: str) -> LocalDatabase:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def close(self) -> None:
+        """
+        Accepted for API compatibility.
+        """
+
+
+def load_snapshot(path: str, key) -> Union[bytes, None]:
+    """
+    Function to read a snapshot file if it was written for the same key.
+    """
+    try:
+        with open(path, "rb") as file:
+            snapshot_key, snapshot = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+        return None
+    return snapshot if snapshot_key == key else None
+
+
+def save_snapshot(path: str, key, snapshot: bytes) -> None:
+    """
+    Function to write a snapshot file atomically.
+    """
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp_path, "wb") as file:
+            pickle.dump((key, snapshot), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _seed_key(collections: list) -> tuple:
+    key = [SNAPSHOT_VERSION]
+    for collection in collections:
+        json_file = os.path.join(TEST_DATA_DIR, "test_" + collection + ".json")
+        if os.path.exists(json_file):
+            stat = os.stat(json_file)
+            key.append((collection, stat.st_size, stat.st_mtime_ns))
+    return tuple(key)
+
+
+def seeded_database(collections: list) -> LocalDatabase:
+    """
+    Function to create a LocalDatabase holding the test data. The JSON files are
+    only parsed when the seed changed, otherwise the database is restored from
+    a snapshot kept in memory and in SNAPSHOT_PATH.
+    """
+    key = _seed_key(collections)
+    snapshot = _seed_snapshots.get(key) or load_snapshot(SNAPSHOT_PATH, key)
+    database = LocalClient().testdb
+    if snapshot is None:
+        add_test_data_to_db(database, collections)
+        snapshot = database.snapshot()
+        save_snapshot(SNAPSHOT_PATH, key, snapshot)
+    else:
+        database.restore(snapshot)
+    _seed_snapshots[key] = snapshot
+    return database
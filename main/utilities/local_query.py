@@ -0,0 +1,815 @@
+"""
+Query, update, projection and aggregation evaluation on plain documents,
+following the MongoDB semantics needed by the local database backend.
+"""
+
+import copy
+import functools
+import math
+import operator as operator_module
+from typing import Callable, Iterable, Union
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+_MISSING = object()
+_QUERY_OPERATORS = (
+    "$eq",
+    "$ne",
+    "$gt",
+    "$gte",
+    "$lt",
+    "$lte",
+    "$in",
+    "$nin",
+    "$exists",
+    "$all",
+    "$size",
+    "$elemMatch",
+    "$not",
+)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def equal(left, right) -> bool:
+    """
+    BSON equality: numbers compare by value, sub-documents by ordered fields.
+    """
+    if _is_number(left) and _is_number(right):
+        return left == right
+    if isinstance(left, bool) or isinstance(right, bool):
+        return type(left) is type(right) and left == right
+    if isinstance(left, dict) and isinstance(right, dict):
+        return list(left) == list(right) and all(
+            equal(left[key], right[key]) for key in left
+        )
+    if isinstance(left, list) and isinstance(right, list):
+        return len(left) == len(right) and all(equal(i, j) for i, j in zip(left, right))
+    return type(left) is type(right) and left == right
+
+
+def _sort_key(value) -> tuple:
+    """
+    Key following the BSON comparison order of the types DBOps stores.
+    """
+    # pylint: disable=too-many-return-statements
+    if value is None or value is _MISSING:
+        return (1, 0)
+    if _is_number(value):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    if isinstance(value, dict):
+        return (4, tuple((k, _sort_key(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return (5, tuple(_sort_key(v) for v in value))
+    if isinstance(value, ObjectId):
+        return (7, value.binary)
+    if isinstance(value, bool):
+        return (8, value)
+    return (9, value)
+
+
+def hashable(value):
+    """
+    Hash key of a value, consistent with equal for the indexed types.
+    """
+    if isinstance(value, dict):
+        return ("dict", tuple((k, hashable(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return ("list", tuple(hashable(v) for v in value))
+    if isinstance(value, bool):
+        return ("bool", value)
+    return value
+
+
+def resolve(doc, parts: list) -> list:
+    """
+    Values reached by a dotted path, traversing arrays like a MongoDB query.
+    """
+    if not parts:
+        return [doc]
+    head, rest = parts[0], parts[1:]
+    if isinstance(doc, dict):
+        if head not in doc:
+            return []
+        return resolve(doc[head], rest)
+    if isinstance(doc, list):
+        values = []
+        if head.isdigit() and int(head) < len(doc):
+            values.extend(resolve(doc[int(head)], rest))
+        for item in doc:
+            if isinstance(item, dict):
+                values.extend(resolve(item, parts))
+        return values
+    return []
+
+
+def expand(values: list) -> list:
+    """
+    Values followed by the elements of those that are arrays.
+    """
+    expanded = []
+    for value in values:
+        expanded.append(value)
+        if isinstance(value, list):
+            expanded.extend(value)
+    return expanded
+
+
+def _compare(value, operand, operator: str) -> bool:
+    if _is_number(value) != _is_number(operand):
+        return False
+    if not _is_number(value) and type(value) is not type(operand):
+        return False
+    if operator == "$gt":
+        return value > operand
+    if operator == "$gte":
+        return value >= operand
+    if operator == "$lt":
+        return value < operand
+    return value <= operand
+
+
+def _match_equal(values: list, operand) -> bool:
+    if not values:
+        return operand is None
+    return any(equal(value, operand) for value in expand(values))
+
+
+def _match_operator(values: list, operator: str, operand) -> bool:
+    # pylint: disable=too-many-return-statements
+    if operator == "$eq":
+        return _match_equal(values, operand)
+    if operator == "$ne":
+        return not _match_equal(values, operand)
+    if operator in ("$gt", "$gte", "$lt", "$lte"):
+        return any(_compare(v, operand, operator) for v in expand(values))
+    if operator == "$in":
+        return any(_match_equal(values, i) for i in operand)
+    if operator == "$nin":
+        return not any(_match_equal(values, i) for i in operand)
+    if operator == "$exists":
+        return bool(values) == bool(operand)
+    if operator == "$all":
+        return any(
+            isinstance(v, list) and all(any(equal(e, i) for e in v) for i in operand)
+            for v in values
+        ) or (len(operand) == 1 and _match_equal(values, operand[0]))
+    if operator == "$size":
+        return any(isinstance(v, list) and len(v) == operand for v in values)
+    if operator == "$elemMatch":
+        return any(
+            isinstance(v, list) and any(_match_element(item, operand) for item in v)
+            for v in values
+        )
+    if operator == "$not":
+        return not _match_condition(values, operand)
+    raise OperationFailure("Unsupported query operator {}.".format(operator))
+
+
+def is_operator_dict(value) -> bool:
+    """
+    Whether a query condition is a {"$operator": ...} dict.
+    """
+    return isinstance(value, dict) and bool(value) and next(iter(value)).startswith("$")
+
+
+def _match_condition(values: list, condition) -> bool:
+    if is_operator_dict(condition):
+        return all(
+            _match_operator(values, operator, operand)
+            for operator, operand in condition.items()
+        )
+    return _match_equal(values, condition)
+
+
+def _match_element(item, condition: dict) -> bool:
+    if is_operator_dict(condition) and next(iter(condition)) in _QUERY_OPERATORS:
+        return _match_condition([item], condition)
+    return isinstance(item, dict) and matches(item, condition)
+
+
+def matches(doc: dict, query: dict) -> bool:
+    """
+    Function to check whether a document satisfies a MongoDB query filter.
+    """
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, sub) for sub in condition):
+                return False
+        elif not _match_condition(resolve(doc, key.split(".")), condition):
+            return False
+    return True
+
+
+def _get_path(doc, path: str, default=None):
+    for part in path.split("."):
+        if isinstance(doc, dict) and part in doc:
+            doc = doc[part]
+        elif isinstance(doc, list) and part.isdigit() and int(part) < len(doc):
+            doc = doc[int(part)]
+        else:
+            return default
+    return doc
+
+
+def _set_path(doc: dict, path: str, value) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        if isinstance(doc, list):
+            doc = doc[int(part)]
+        else:
+            if not isinstance(doc.get(part), (dict, list)):
+                doc[part] = {}
+            doc = doc[part]
+    if isinstance(doc, list):
+        index = int(parts[-1])
+        doc.extend([None] * (index + 1 - len(doc)))
+        doc[index] = value
+    else:
+        doc[parts[-1]] = value
+
+
+def _unset_path(doc: dict, path: str) -> None:
+    parent_path, _, key = path.rpartition(".")
+    parent = _get_path(doc, parent_path) if parent_path else doc
+    if isinstance(parent, dict):
+        parent.pop(key, None)
+
+
+def _array_at(doc: dict, path: str, operator: str) -> list:
+    array = _get_path(doc, path, _MISSING)
+    if array is _MISSING or array is None:
+        array = []
+        _set_path(doc, path, array)
+    if not isinstance(array, list):
+        raise OperationFailure("{} requires an array at '{}'.".format(operator, path))
+    return array
+
+
+def _each(value) -> list:
+    if isinstance(value, dict) and "$each" in value:
+        return list(value["$each"])
+    return [value]
+
+
+def apply_update(doc: dict, update: dict) -> None:
+    """
+    Function to apply MongoDB update operators to a document in place.
+    """
+    # pylint: disable=too-many-branches
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            if operator == "$set":
+                _set_path(doc, path, copy.deepcopy(value))
+            elif operator == "$unset":
+                _unset_path(doc, path)
+            elif operator == "$inc":
+                _set_path(doc, path, _get_path(doc, path, 0) + value)
+            elif operator in ("$min", "$max"):
+                current = _get_path(doc, path, _MISSING)
+                if (
+                    current is _MISSING
+                    or (operator == "$min" and _sort_key(value) < _sort_key(current))
+                    or (operator == "$max" and _sort_key(value) > _sort_key(current))
+                ):
+                    _set_path(doc, path, copy.deepcopy(value))
+            elif operator == "$addToSet":
+                array = _array_at(doc, path, operator)
+                for item in _each(value):
+                    if not any(equal(item, i) for i in array):
+                        array.append(copy.deepcopy(item))
+            elif operator == "$push":
+                _array_at(doc, path, operator).extend(copy.deepcopy(_each(value)))
+            elif operator == "$pull":
+                array = _array_at(doc, path, operator)
+                array[:] = [i for i in array if not _match_element(i, value)]
+            else:
+                raise OperationFailure(
+                    "Unsupported update operator {}.".format(operator)
+                )
+
+
+def _projection_tree(paths: Iterable[str]) -> dict:
+    tree = {}
+    for path in paths:
+        node = tree
+        parts = path.split(".")
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+            if node is True:
+                break
+        else:
+            node[parts[-1]] = True
+    return tree
+
+
+def _include(value, tree: dict):
+    if isinstance(value, list):
+        return [_include(i, tree) for i in value if isinstance(i, (dict, list))]
+    out = {}
+    for key, item in value.items():
+        if key not in tree:
+            continue
+        if tree[key] is True:
+            out[key] = copy.deepcopy(item)
+        elif isinstance(item, (dict, list)):
+            out[key] = _include(item, tree[key])
+    return out
+
+
+def project(doc: dict, projection: Union[dict, Iterable, None]) -> dict:
+    """
+    Function to apply a find() projection to a document, returning a copy.
+    As in pymongo, an empty projection only returns _id.
+    """
+    if projection is None:
+        return copy.deepcopy(doc)
+    if not isinstance(projection, dict):
+        projection = {field: 1 for field in projection}
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+
+    if all(fields.values()) and (fields or include_id):
+        tree = _projection_tree(fields)
+        if include_id:
+            tree["_id"] = True
+        return _include(doc, tree)
+
+    out = copy.deepcopy(doc)
+    for path in fields:
+        _unset_path(out, path)
+    if not include_id:
+        out.pop("_id", None)
+    return out
+
+
+def sort_spec(key_or_list, direction=None) -> list:
+    """
+    Sort or index keys as a list of (field, direction) pairs.
+    """
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    return list(key_or_list)
+
+
+def sort_docs(docs: list, spec: list) -> list:
+    """
+    Documents sorted by a list of (field, direction) pairs.
+    """
+    for key, direction in reversed(spec):
+        docs = sorted(
+            docs,
+            key=lambda d, k=key: _sort_key(_get_path(d, k, None)),
+            reverse=direction == -1,
+        )
+    return docs
+
+
+def _field_path(value, parts: list):
+    """
+    Value of a field path in an aggregation expression, arrays being mapped.
+    """
+    for index, part in enumerate(parts):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list):
+            values = [_field_path(item, parts[index:]) for item in value]
+            return [v for v in values if v is not _MISSING]
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def _variable(expression: str, doc: dict, variables: dict):
+    name, _, path = expression[2:].partition(".")
+    if name in ("ROOT", "CURRENT"):
+        value = doc
+    elif name in variables:
+        value = variables[name]
+    else:
+        raise OperationFailure("Undefined variable {}.".format(name))
+    return _field_path(value, path.split(".")) if path else value
+
+
+def _null(value) -> bool:
+    return value is None or value is _MISSING
+
+
+def _numbers(values: list) -> list:
+    return [v for v in values if _is_number(v)]
+
+
+def _to_object_id(value):
+    if _null(value) or isinstance(value, ObjectId):
+        return None if value is _MISSING else value
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    raise OperationFailure("Failed to convert {!r} to objectId.".format(value))
+
+
+def _convert(spec: dict, doc: dict, variables: dict):
+    # pylint: disable=too-many-return-statements
+    value = evaluate(spec["input"], doc, variables)
+    if _null(value):
+        return evaluate(spec.get("onNull"), doc, variables)
+    target = spec["to"]
+    try:
+        if target in ("objectId", 7):
+            return _to_object_id(value)
+        if target in ("string", 2):
+            return str(value)
+        if target in ("double", 1, "decimal", 19):
+            return float(value)
+        if target in ("int", 16, "long", 18):
+            return int(value)
+        if target in ("bool", 8):
+            return bool(value)
+    except (OperationFailure, ValueError, TypeError):
+        if "onError" in spec:
+            return evaluate(spec["onError"], doc, variables)
+        raise
+    raise OperationFailure("Unsupported $convert target {}.".format(target))
+
+
+def _round(value, places):
+    if _null(value):
+        return None
+    return round(value, places) if places else float(round(value))
+
+
+def _array_operator(operator: str, spec: dict, doc: dict, variables: dict):
+    items = evaluate(spec["input"], doc, variables)
+    if _null(items):
+        return None
+    name = spec.get("as", "this")
+    if operator == "$filter":
+        return [
+            item
+            for item in items
+            if _truthy(evaluate(spec["cond"], doc, {**variables, name: item}))
+        ]
+    if operator == "$map":
+        return [evaluate(spec["in"], doc, {**variables, name: item}) for item in items]
+    value = evaluate(spec["initialValue"], doc, variables)
+    for item in items:
+        value = evaluate(spec["in"], doc, {**variables, "this": item, "value": value})
+    return value
+
+
+def _truthy(value) -> bool:
+    return not (_null(value) or value is False or (_is_number(value) and value == 0))
+
+
+_BINARY = {
+    "$subtract": operator_module.sub,
+    "$divide": operator_module.truediv,
+    "$pow": math.pow,
+    "$mod": math.fmod,
+}
+_COMPARISONS = {
+    "$eq": equal,
+    "$ne": lambda a, b: not equal(a, b),
+    "$gt": lambda a, b: _sort_key(a) > _sort_key(b),
+    "$gte": lambda a, b: _sort_key(a) >= _sort_key(b),
+    "$lt": lambda a, b: _sort_key(a) < _sort_key(b),
+    "$lte": lambda a, b: _sort_key(a) <= _sort_key(b),
+}
+
+
+def _operator(operator: str, operand, doc: dict, variables: dict):
+    # pylint: disable=too-many-return-statements,too-many-branches,too-many-statements
+    if operator == "$literal":
+        return operand
+    if operator in ("$filter", "$map", "$reduce"):
+        return _array_operator(operator, operand, doc, variables)
+    if operator == "$let":
+        scope = {
+            **variables,
+            **{k: evaluate(v, doc, variables) for k, v in operand["vars"].items()},
+        }
+        return evaluate(operand["in"], doc, scope)
+    if operator == "$convert":
+        return _convert(operand, doc, variables)
+    if operator == "$cond":
+        if isinstance(operand, dict):
+            operand = [operand["if"], operand["then"], operand["else"]]
+        branch = 1 if _truthy(evaluate(operand[0], doc, variables)) else 2
+        return evaluate(operand[branch], doc, variables)
+    if operator == "$ifNull":
+        for item in operand:
+            value = evaluate(item, doc, variables)
+            if not _null(value):
+                return value
+        return None
+    if operator == "$switch":
+        for branch in operand["branches"]:
+            if _truthy(evaluate(branch["case"], doc, variables)):
+                return evaluate(branch["then"], doc, variables)
+        return evaluate(operand.get("default"), doc, variables)
+
+    args = operand if isinstance(operand, list) else [operand]
+    args = [evaluate(arg, doc, variables) for arg in args]
+    if operator in ("$sum", "$avg", "$min", "$max") and len(args) == 1:
+        values = args[0] if isinstance(args[0], list) else args
+    else:
+        values = args
+    if operator == "$sum":
+        return sum(_numbers(values))
+    if operator == "$avg":
+        numbers = _numbers(values)
+        return sum(numbers) / len(numbers) if numbers else None
+    if operator in ("$min", "$max"):
+        values = [v for v in values if not _null(v)]
+        if not values:
+            return None
+        return (min if operator == "$min" else max)(values, key=_sort_key)
+    if operator in ("$add", "$multiply"):
+        if any(_null(v) for v in args):
+            return None
+        return functools.reduce(
+            operator_module.add if operator == "$add" else operator_module.mul, args
+        )
+    if operator in _BINARY:
+        return None if any(_null(v) for v in args) else _BINARY[operator](*args)
+    if operator in ("$sqrt", "$abs", "$floor", "$ceil"):
+        if _null(args[0]):
+            return None
+        function = {"$sqrt": math.sqrt, "$abs": abs, "$floor": math.floor}
+        return function.get(operator, math.ceil)(args[0])
+    if operator in ("$round", "$trunc"):
+        places = args[1] if len(args) > 1 else 0
+        if operator == "$trunc":
+            return (
+                None
+                if _null(args[0])
+                else math.trunc(args[0] * 10**places) / (10**places)
+            )
+        return _round(args[0], places)
+    if operator in _COMPARISONS:
+        return _COMPARISONS[operator](*(None if _null(v) else v for v in args))
+    if operator == "$and":
+        return all(_truthy(v) for v in args)
+    if operator == "$or":
+        return any(_truthy(v) for v in args)
+    if operator == "$not":
+        return not _truthy(args[0])
+    if operator == "$in":
+        return any(equal(args[0], item) for item in args[1])
+    if operator == "$size":
+        if not isinstance(args[0], list):
+            raise OperationFailure("$size requires an array.")
+        return len(args[0])
+    if operator == "$isArray":
+        return isinstance(args[0], list)
+    if operator == "$arrayElemAt":
+        array, index = args
+        if _null(array):
+            return None
+        return array[index] if -len(array) <= index < len(array) else _MISSING
+    if operator == "$concatArrays":
+        if any(_null(v) for v in args):
+            return None
+        return [item for array in args for item in array]
+    if operator in ("$setUnion", "$setIntersection", "$setDifference"):
+        return _set_operator(operator, args)
+    if operator == "$range":
+        return list(range(*args))
+    if operator == "$toObjectId":
+        return _to_object_id(args[0])
+    if operator == "$toString":
+        return None if _null(args[0]) else str(args[0])
+    if operator == "$type":
+        return _type_name(args[0])
+    raise OperationFailure("Unsupported expression operator {}.".format(operator))
+
+
+def _set_operator(operator: str, arrays: list) -> list:
+    if any(_null(v) for v in arrays):
+        return None
+    result = []
+    if operator == "$setUnion":
+        candidates = [item for array in arrays for item in array]
+    else:
+        candidates = arrays[0]
+    for item in candidates:
+        if any(equal(item, i) for i in result):
+            continue
+        if operator == "$setIntersection" and not all(
+            any(equal(item, i) for i in array) for array in arrays[1:]
+        ):
+            continue
+        if operator == "$setDifference" and any(equal(item, i) for i in arrays[1]):
+            continue
+        result.append(item)
+    return result
+
+
+def _type_name(value) -> str:
+    # pylint: disable=too-many-return-statements
+    if value is _MISSING:
+        return "missing"
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int" if -(2**31) <= value < 2**31 else "long"
+    if isinstance(value, float):
+        return "double"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, list):
+        return "array"
+    if isinstance(value, dict):
+        return "object"
+    if isinstance(value, ObjectId):
+        return "objectId"
+    return type(value).__name__
+
+
+def evaluate(expression, doc: dict, variables: dict = None):
+    """
+    Function to evaluate an aggregation expression against a document.
+    Missing fields evaluate to an internal marker, see _null.
+    """
+    variables = variables or {}
+    if isinstance(expression, str) and expression.startswith("$$"):
+        return _variable(expression, doc, variables)
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _field_path(doc, expression[1:].split("."))
+    if isinstance(expression, list):
+        return [_value(evaluate(item, doc, variables)) for item in expression]
+    if isinstance(expression, dict):
+        if len(expression) == 1 and next(iter(expression)).startswith("$"):
+            operator, operand = next(iter(expression.items()))
+            return _operator(operator, operand, doc, variables)
+        return {
+            key: value
+            for key, value in (
+                (k, evaluate(v, doc, variables)) for k, v in expression.items()
+            )
+            if value is not _MISSING
+        }
+    return expression
+
+
+def _value(value):
+    return None if value is _MISSING else value
+
+
+def _set_fields(doc: dict, fields: dict) -> dict:
+    out = copy.copy(doc)
+    for path, expression in fields.items():
+        value = evaluate(expression, doc)
+        if value is _MISSING:
+            continue
+        if "." in path:
+            out = copy.deepcopy(out) if out is doc else out
+        _set_path(out, path, copy.deepcopy(value))
+    return out
+
+
+def _project_stage(doc: dict, spec: dict) -> dict:
+    computed = {
+        k: v
+        for k, v in spec.items()
+        if not (isinstance(v, (bool, int)) and not isinstance(v, float))
+    }
+    flags = {k: v for k, v in spec.items() if k not in computed}
+    if computed or any(v for k, v in flags.items() if k != "_id"):
+        out = project(doc, {k: 1 for k, v in flags.items() if v} or {"_id": 1})
+        if flags.get("_id", 1) in (0, False):
+            out.pop("_id", None)
+        for path, expression in computed.items():
+            value = evaluate(expression, doc)
+            if value is not _MISSING:
+                _set_path(out, path, copy.deepcopy(value))
+        return out
+    return project(doc, flags)
+
+
+def _lookup(doc: dict, spec: dict, find: Callable) -> dict:
+    value = _field_path(doc, spec["localField"].split("."))
+    if isinstance(value, list):
+        query = {spec["foreignField"]: {"$in": value}}
+    else:
+        query = {spec["foreignField"]: _value(value)}
+    out = copy.copy(doc)
+    out[spec["as"]] = copy.deepcopy(find(spec["from"], query))
+    return out
+
+
+def _unwind(docs: list, spec) -> list:
+    if isinstance(spec, str):
+        spec = {"path": spec}
+    path = spec["path"][1:]
+    keep_empty = spec.get("preserveNullAndEmptyArrays", False)
+    out = []
+    for doc in docs:
+        value = _get_path(doc, path, _MISSING)
+        if isinstance(value, list) and value:
+            for item in value:
+                unwound = copy.copy(doc)
+                _set_path(unwound, path, item)
+                out.append(unwound)
+        elif keep_empty:
+            unwound = copy.copy(doc)
+            if isinstance(value, list):
+                _unset_path(unwound, path)
+            out.append(unwound)
+        elif (
+            value is not _MISSING and not isinstance(value, list) and value is not None
+        ):
+            out.append(doc)
+    return out
+
+
+def _accumulate(operator: str, values: list):
+    # pylint: disable=too-many-return-statements
+    present = [v for v in values if not _null(v)]
+    if operator == "$sum":
+        return sum(_numbers(values))
+    if operator == "$avg":
+        numbers = _numbers(values)
+        return sum(numbers) / len(numbers) if numbers else None
+    if operator in ("$min", "$max"):
+        if not present:
+            return None
+        return (min if operator == "$min" else max)(present, key=_sort_key)
+    if operator == "$push":
+        return [_value(v) for v in values]
+    if operator == "$addToSet":
+        return _set_operator("$setUnion", [[_value(v) for v in values]])
+    if operator == "$first":
+        return _value(values[0]) if values else None
+    if operator == "$last":
+        return _value(values[-1]) if values else None
+    raise OperationFailure("Unsupported accumulator {}.".format(operator))
+
+
+def _group(docs: list, spec: dict) -> list:
+    groups = {}
+    for doc in docs:
+        key = _value(evaluate(spec["_id"], doc))
+        groups.setdefault(hashable(key), (key, []))[1].append(doc)
+    out = []
+    for key, members in groups.values():
+        result = {"_id": key}
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            operator, expression = next(iter(accumulator.items()))
+            values = [evaluate(expression, doc) for doc in members]
+            result[field] = _accumulate(operator, values)
+        out.append(result)
+    return out
+
+
+def run_pipeline(docs: list, pipeline: list, find: Callable) -> list:
+    """
+    Function to run an aggregation pipeline over a list of documents,
+    find(collection_name, query) returning the documents $lookup joins.
+    """
+    # pylint: disable=too-many-branches
+    for stage in pipeline:
+        name, spec = next(iter(stage.items()))
+        if name == "$match":
+            docs = [doc for doc in docs if matches(doc, spec)]
+        elif name in ("$addFields", "$set"):
+            docs = [_set_fields(doc, spec) for doc in docs]
+        elif name == "$project":
+            docs = [_project_stage(doc, spec) for doc in docs]
+        elif name == "$unset":
+            fields = [spec] if isinstance(spec, str) else spec
+            docs = [project(doc, {field: 0 for field in fields}) for doc in docs]
+        elif name == "$replaceRoot":
+            docs = [evaluate(spec["newRoot"], doc) for doc in docs]
+        elif name == "$lookup":
+            docs = [_lookup(doc, spec, find) for doc in docs]
+        elif name == "$unwind":
+            docs = _unwind(docs, spec)
+        elif name == "$group":
+            docs = _group(docs, spec)
+        elif name == "$sort":
+            docs = sort_docs(docs, list(spec.items()))
+        elif name == "$skip":
+            docs = docs[spec:]
+        elif name == "$limit":
+            docs = docs[:spec]
+        elif name == "$count":
+            docs = [{spec: len(docs)}] if docs else []
+        else:
+            raise OperationFailure("Unsupported pipeline stage {}.".format(name))
+    return docs
@@ -3,13 +3,28 @@ Utilities for database operations.
 """
 
 import os
+import csv
 import math
 import datetime
-import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union, List
 import pprint
+import bson
 import pymongo
-from bson.json_util import loads
+import yaml
+from bson.codec_options import CodecOptions
+from bson.json_util import JSONOptions, loads
+from bson.tz_util import utc
+
+ROOT_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), "..", ".."))
+TEST_DATA_DIR = os.path.join(ROOT_DIR, "tests", "data", "initial_inmemory_data")
+
+_config_cache = {}
+
+# both decoders return the same aware UTC datetimes
+_SEED_JSON_OPTIONS = JSONOptions(tz_aware=True, tzinfo=utc)
+_SEED_CODEC_OPTIONS = CodecOptions(tz_aware=True, tzinfo=utc)
 
 
 def calculate_bmi(
@@ -17,8 +32,12 @@ def calculate_bmi(
 ) -> Union[float, None]:
     """
     Function to calculate the Body Mass Index (BMI) based on weight in kg and height in meters.
+    Sequences or numpy arrays are computed element-wise into a numpy array
+    with NaN for missing values, see _body_index.
     """
 
+    if _is_sequence(weight) or _is_sequence(height):
+        return _body_index(lambda w, h: w / (h / 100) ** 2, weight, height)
     if weight is None or height is None:
         return None
     bmi = round(weight / math.pow(height / 100, 2), 2)
@@ -33,8 +52,12 @@ def calculate_mosteller_bsa(
     """
     Function to calculate the Mosteller Body Surface Area (BSA)[m2]
     based on weight in kg and height in centimeters.
+    Sequences or numpy arrays are computed element-wise into a numpy array
+    with NaN for missing values, see _body_index.
     """
 
+    if _is_sequence(weight) or _is_sequence(height):
+        return _body_index(lambda w, h: (w * h / 3600) ** 0.5, weight, height)
     if weight is None or height is None:
         return None
     bsa = round(math.sqrt(weight * height / 3600), 2)
@@ -43,6 +66,37 @@ def calculate_mosteller_bsa(
     return bsa
 
 
+def _is_sequence(value) -> bool:
+    return isinstance(value, (list, tuple)) or getattr(value, "ndim", 0) > 0
+
+
+def _body_index(expression, weight, height):
+    """
+    Function to apply a body index element-wise over weights and heights given
+    as sequences or numpy arrays of the same length (a scalar is used for every
+    element), with None or NaN for missing values.
+
+    Return a numpy float array of the indices rounded like round(), with NaN
+    where the index is missing or invalid.
+    """
+    import numpy  # pylint: disable=import-outside-toplevel
+
+    weight, height = [numpy.asarray(i, dtype=float) for i in (weight, height)]
+    if weight.ndim and height.ndim and weight.shape != height.shape:
+        raise ValueError("Weight and height must have the same length.")
+    with numpy.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        values = expression(weight, height)
+        rounded = numpy.round(values, 2)
+        # numpy rounds values * 100, which can land on the other side of a
+        # half-way point than round() does; those few are redone with round()
+        scaled = values * 100
+        ties = numpy.flatnonzero(numpy.abs(scaled - numpy.floor(scaled) - 0.5) < 1e-6)
+    for index in ties:
+        rounded.flat[index] = round(float(values.flat[index]), 2)
+    rounded[~numpy.isfinite(rounded)] = numpy.nan
+    return rounded
+
+
 def get_current_datetime() -> datetime.datetime:
     """
     Function to get the current UTC datetime.
@@ -58,38 +112,94 @@ def _add_date_time(doc: dict) -> None:
         doc["datetime_creation"] = get_current_datetime()
 
 
-def _add_documents_to_collection(filename: str, collection: str) -> None:
+def load_seed_documents(filename: str) -> list:
     """
-    Function to insert json files into a MongoDB collection.
+    Function to read the documents of an extended JSON seed file.
+    The file is decoded in a single pass and the result is cached in a BSON
+    snapshot next to it ("<name>.snapshot.bson"), keyed by the file hash, which
+    is restored instead of decoding the JSON again while the file is unchanged.
     """
 
-    with open(filename, encoding="utf-8") as file:
-        file_data = json.load(file)
+    with open(filename, "rb") as file:
+        data = file.read()
+    digest = hashlib.sha256(data).hexdigest()
+    snapshot = os.path.splitext(filename)[0] + ".snapshot.bson"
+
+    try:
+        with open(snapshot, "rb") as file:
+            header, *documents = bson.decode_all(file.read(), _SEED_CODEC_OPTIONS)
+        if header.get("sha256") == digest:
+            return documents
+    except (OSError, ValueError, bson.errors.BSONError):
+        pass
 
-    file_data = loads(json.dumps(file_data))
-    if isinstance(file_data, list):
-        for document in file_data:
-            _add_date_time(document)
-        collection.insert_many(file_data)
-    else:
-        _add_date_time(file_data)
-        collection.insert_one(file_data)
+    documents = loads(data.decode("utf-8"), json_options=_SEED_JSON_OPTIONS)
+    if isinstance(documents, dict):
+        documents = [documents]
+    tmp_snapshot = "{}.{}.tmp".format(snapshot, os.getpid())
+    try:
+        with open(tmp_snapshot, "wb") as file:
+            for document in [{"sha256": digest}] + documents:
+                file.write(bson.encode(document))
+        os.replace(tmp_snapshot, snapshot)
+    except OSError:
+        if os.path.exists(tmp_snapshot):
+            os.remove(tmp_snapshot)
+    return documents
+
+
+def _add_documents_to_collection(
+    filename: str, collection: pymongo.collection.Collection
+) -> None:
+    """
+    Function to insert json files into a MongoDB collection.
+    """
+
+    documents = load_seed_documents(filename)
+    for document in documents:
+        _add_date_time(document)
+    if documents:
+        collection.insert_many(documents)
 
 
 def add_test_data_to_db(database: pymongo.database.Database, collections: list) -> None:
     """
     Function to add the test json files to a MongoDB database.
+    Collections are loaded in parallel, missing test files are skipped.
     """
 
-    root_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), "..", ".."))
-    test_data_dir = os.path.join(root_dir, "tests", "data", "initial_inmemory_data")
+    json_files = {
+        collection: os.path.join(TEST_DATA_DIR, "test_" + collection + ".json")
+        for collection in collections
+    }
+    json_files = {k: v for k, v in json_files.items() if os.path.exists(v)}
+    if not json_files:
+        return
+    with ThreadPoolExecutor(max_workers=min(8, len(json_files))) as executor:
+        futures = [
+            executor.submit(_add_documents_to_collection, json_file, database[name])
+            for name, json_file in json_files.items()
+        ]
+        for future in futures:
+            future.result()
 
-    for collection in collections:
-        try:
-            json_file = os.path.join(test_data_dir, "test_" + collection + ".json")
-            _add_documents_to_collection(json_file, database[collection])
-        except FileNotFoundError:
-            pass
+
+def load_config(path: str = None) -> dict:
+    """
+    Function to load the config.yaml file. The parsed configuration is cached
+    for the process and only re-read when the file modification time changes.
+    The returned dict is shared between callers and must not be modified.
+    """
+    if path is None:
+        path = os.path.join(ROOT_DIR, "config.yaml")
+
+    mtime = os.stat(path).st_mtime_ns
+    cached = _config_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, encoding="utf-8") as yml:
+            cached = (mtime, yaml.full_load(yml))
+        _config_cache[path] = cached
+    return cached[1]
 
 
 def json_printer(obj: Union[dict, list]):
@@ -112,3 +222,27 @@ def fcsv2list(path_to_fcsv: str) -> List[float]:
                 x_splitted = x.split(",")
                 landmarks.append([float(i) for i in x_splitted[1:4]])
     return landmarks
+
+
+def csv2dicts(path_to_csv: str) -> List[dict]:
+    """
+    Function to get the rows of a csv file with a header line into a list of
+    dicts. Numeric values are converted to int/float and empty ones dropped.
+    """
+    rows = []
+    with open(path_to_csv, "r", encoding="utf-8", newline="") as csv_file:
+        for row in csv.DictReader(csv_file):
+            record = {}
+            for key, value in row.items():
+                value = (value or "").strip()
+                if not value:
+                    continue
+                for cast in (int, float):
+                    try:
+                        value = cast(value)
+                        break
+                    except ValueError:
+                        pass
+                record[key.strip()] = value
+            rows.append(record)
+    return rows
@@ -0,0 +1,47 @@
+"""
+Test units for asynchronous database operations.
+"""
+# pylint: disable=missing-function-docstring
+import asyncio
+import pytest
+from main.async_database_ops import AsyncDBOps
+
+
+class TestAsyncDBOps:
+    """Test class for async_database_ops file."""
+
+    def test_concurrent_lookups(self):
+        async def lookups():
+            async with AsyncDBOps("local", max_concurrency=4) as database:
+                return await asyncio.gather(
+                    database.get_patient_collection(850, "SER00002"),
+                    database.get_patient_collection(740, ["SER00009", "SER00008"]),
+                    database.get_patient_model_list(663),
+                )
+
+        patient_850, patient_740, models_663 = asyncio.run(lookups())
+        assert patient_850[0]["internal_info"]["internal_id"] == 850
+        assert int(patient_740[0]["age"]) == 83
+        assert models_663[-1]["timestamp"] == 0.9
+
+    def test_errors_propagate(self):
+        async def duplicate_lookup():
+            async with AsyncDBOps("local") as database:
+                await database.get_patient_collection(843)
+
+        with pytest.raises(SystemExit):
+            asyncio.run(duplicate_lookup())
+
+    def test_generators_become_async_iterators(self):
+        async def listing():
+            async with AsyncDBOps("local") as database:
+                database.iter_batch = 2
+                return [
+                    pair
+                    async for pair in database.iter_all_patients_patientcoll(
+                        batch_size=2
+                    )
+                ]
+
+        query = asyncio.run(listing())
+        assert [internal_id for internal_id, _ in query] == [663, 740, 843, 843, 850]
@@ -1,16 +1,18 @@
 """
 Test units for database operations.
 """
-# pylint: disable=missing-function-docstring
+# pylint: disable=missing-function-docstring,too-many-public-methods
 import os
+import datetime
 import pytest
+from bson import ObjectId
 from main.database_ops import DBOps
 
 
 class TestDBOps:
     """Test class for database_ops file."""
 
-    db = DBOps("inmemory")
+    db = DBOps("local")
     jsondir = "tests/data/upload_data/"
 
     def test_db_init(self):
@@ -22,6 +24,22 @@ class TestDBOps:
             > 1
         )
 
+    def test_ensure_indexes(self):
+        self.db.ensure_indexes()
+        index_keys = [
+            i["key"] for i in self.db.database.patient.index_information().values()
+        ]
+        assert [
+            ("internal_info.internal_id", 1),
+            ("internal_info.series", 1),
+        ] in index_keys
+        index_keys = [
+            i["key"]
+            for i in self.db.database["patient-cohort"].index_information().values()
+        ]
+        assert [("cohort_name", 1)] in index_keys
+        assert [("patient_ids", 1)] in index_keys
+
     def test_get_patient_collection(self, capsys):
         query = self.db.get_patient_collection(850, "SER00002")
         query_1 = self.db.get_patient_collection(850)
@@ -44,12 +62,114 @@ class TestDBOps:
         assert int(query_2[0]["age"]) == 83 == int(query_3[0]["age"])
         assert query_2[0]["ed_timestamp"] == 0.82 == query_3[0]["ed_timestamp"]
         assert query_2[0]["es_timestamp"] == 0.4 == query_3[0]["es_timestamp"]
+        assert self.db.get_patient_collection(740, ["SER00008"]) == []
+        assert (
+            self.db.get_patient_collection(740, ["SER00009", "SER00008", "SER00010"])
+            == []
+        )
 
         with pytest.raises(SystemExit):
             self.db.get_patient_collection(843)
             out, _ = capsys.readouterr()
             assert out == "More than one patient entry found."
 
+    def test_get_patient_collections(self, capsys):
+        pairs = [
+            (850, "SER00002"),
+            (740, ["SER00009", "SER00008"]),
+            (843, "SER00005"),
+            (663, None),
+            (999, "SER00001"),
+        ]
+        query = self.db.get_patient_collections(pairs, chunk_size=2)
+        assert list(query) == [
+            (850, "SER00002"),
+            (740, ("SER00009", "SER00008")),
+            (843, "SER00005"),
+            (663, None),
+            (999, "SER00001"),
+        ]
+        assert int(query[(850, "SER00002")]["age"]) == 46
+        assert int(query[(740, ("SER00009", "SER00008"))]["age"]) == 83
+        assert query[(843, "SER00005")]["internal_info"]["series"] == "SER00005"
+        assert query[(663, None)]["models"] == "62c4169ec51848f33f999999"
+        assert query[(999, "SER00001")] is None
+
+        with pytest.raises(SystemExit):
+            self.db.get_patient_collections([(850, None), (843, None)])
+            out, _ = capsys.readouterr()
+            assert out == "More than one patient entry found."
+
+    def test_getter_fields(self):
+        query = self.db.get_patient_collection(850, "SER00002", fields=["height"])[0]
+        assert set(query) == {"_id", "height"}
+        query = self.db.get_patient_collection(850, fields={"body_rois": 0, "_id": 0})
+        assert "body_rois" not in query[0] and "_id" not in query[0]
+        assert query[0]["age"] == 46
+        query = self.db.get_patient_model_collection(850, fields=["_id"])
+        assert query == {"_id": ObjectId("62c4169ec51848f33fa6b2a2")}
+        query = self.db.get_patient_cohort(
+            cohort_id="626aba549ce90c7ccbe9510c", fields=["cohort_name"]
+        )
+        assert set(query) == {"_id", "cohort_name"}
+        query = self.db.get_patient_collections([(850, None)], fields=["age"])
+        assert set(query[(850, None)]) == {"_id", "age", "internal_info"}
+        query = self.db.get_patient_collections([(850, None)], fields={"age": 1})
+        assert set(query[(850, None)]) == {"_id", "age", "internal_info"}
+        query = self.db.get_patient_collections(
+            [(850, None)], fields={"internal_info": 0, "body_rois": 0}
+        )
+        assert query[(850, None)]["internal_info"]["internal_id"] == 850
+        assert "body_rois" not in query[(850, None)]
+
+        database = DBOps("local", cache_size=16)
+        database.get_patient_collection(850)
+        query = database.get_patient_collection(850, fields=["height", "weight"])
+        assert query[0] == {
+            "_id": ObjectId("5f7f7ee40bf2b2706460424c"),
+            "height": 160.0,
+            "weight": 72.0,
+        }
+
+    def test_get_patient_bundle(self):
+        query = self.db.get_patient_bundle(740, ["SER00009", "SER00008"])
+        assert int(query["patient"]["age"]) == 83
+        assert str(query["models"]["_id"]) == "62b445e077febb2c27a41c7d"
+        assert query["models"]["models"][0]["timestamp"] == 0.82
+        assert query["imaging"] is None
+        assert self.db.get_patient_bundle(999) is None
+
+        query = self.db.get_patient_bundles(
+            [(850, "SER00002"), (663, None)], include=("models",)
+        )
+        assert set(query[(850, "SER00002")]) == {"patient", "models"}
+        assert str(query[(663, None)]["models"]["_id"]) == "62c4169ec51848f33f999999"
+
+    def test_document_cache(self):
+        database = DBOps("local", cache_size=16)
+        query = database.get_patient_collection(850, "SER00002")
+        query[0]["age"] = 0
+        query_2 = database.get_patient_collection(850, "SER00002")
+        assert query_2[0]["age"] == 46
+        assert database.cache.info()["hits"] == 1
+        assert database.cache.info()["misses"] == 1
+
+        database.update_human_demographics(850, age=47)
+        assert database.get_patient_collection(850, "SER00002")[0]["age"] == 47
+        models = database.get_patient_model_list(850)
+        database.update_patient_model_list(850, models[:0])
+        assert database.get_patient_model_list(850) == []
+
+    def test_document_cache_model_list(self):
+        database = DBOps("local", cache_size=64)
+        models = [database.get_patient_model_list(850) for _ in range(3)]
+        assert models[0] == models[2] and models[0]
+        assert database.cache.info()["hits"] == 4
+        assert database.cache.info()["misses"] == 2
+        assert database.cache.info()["size"] == 2
+        database.update_patient_model_list(850, models[0][:1])
+        assert database.get_patient_model_list(850) == models[0][:1]
+
     def test_get_all_patients_patientcoll(self):
         query = self.db.get_all_patients_patientcoll()
         assert query == {
@@ -58,6 +178,13 @@ class TestDBOps:
             843: ["SER00005", "SER00009"],
             850: "SER00002",
         }
+        query = list(self.db.iter_all_patients_patientcoll(batch_size=2))
+        assert query[:3] == [
+            (663, "SER00302"),
+            (740, ["SER00008", "SER00009"]),
+            (843, "SER00005"),
+        ]
+        assert len(query) == 5
 
     def test_get_patient_model_collection(self):
         query = self.db.get_patient_model_collection(850, "SER00002")
@@ -90,6 +217,297 @@ class TestDBOps:
         cohort_doc = self.db.get_patient_cohort(cohort_id=cohort_id)
         assert pat850_id in cohort_doc["patient_ids"]
         assert cohort_doc["number_patients"] == 1
+        assert cohort_doc["height"] == {"min": 160.0, "max": 160.0}
+        assert cohort_doc["weight"] == {"min": 72.0, "max": 72.0}
+        query = self.db.add_patients_to_cohort(cohort_id, [pat850_id, pat850_id])
+        assert query == [pat850_id]
+        assert self.db.get_patient_cohort(cohort_id=cohort_id)["number_patients"] == 1
+        stats = self.db.get_cohort_statistics(cohort_id)
+        assert stats["weight"]["count"] == 1 and stats["weight"]["mean"] == 72.0
+        assert stats["bmi"]["min"] == stats["bmi"]["max"] == 24.06
+        assert stats["height"]["std"] == 0.0
+        assert stats["age"]["histogram"][4] == {"min": 40, "max": 50, "count": 1}
+        assert sum(i["count"] for i in stats["bsa"]["histogram"]) == 1
+
+    def test_get_cohorts_for_patient(self):
+        pat850_id = "5f7f7ee40bf2b2706460424c"
+        pat_id = "626bc8689ce90c7ccbe95128"
+        query = self.db.get_cohorts_for_patient(ObjectId(pat850_id))
+        assert [str(i["_id"]) for i in query] == ["626aba549ce90c7ccbe9520e"]
+        assert not self.db.get_cohorts_for_patient("000000000000000000000000")
+
+        query = self.db.get_cohorts_for_patients(
+            [pat850_id, pat_id, "000000000000000000000000"], fields=["cohort_name"]
+        )
+        assert [i["cohort_name"] for i in query[pat850_id]] == [
+            "Pulsify ES/ED Patients"
+        ]
+        assert query[pat_id] == [
+            {
+                "_id": ObjectId("626aba549ce90c7ccbe9510c"),
+                "cohort_name": "Pulsify ED Patients",
+            }
+        ]
+        assert query["000000000000000000000000"] == []
+
+    def test_iter_cohort_patients(self):
+        cohort_id = "626aba549ce90c7ccbe9520e"
+        database = DBOps("local")
+        pat_ids = [
+            str(database.get_patient_collection(i, s)[0]["_id"])
+            for i, s in [(740, None), (850, None), (843, "SER00005")]
+        ]
+        database.add_patients_to_cohort(cohort_id, pat_ids)
+        query = list(database.iter_cohort_patients(cohort_id, ["age"], chunk_size=2))
+        assert [str(i["_id"]) for i in query] == pat_ids
+        assert [i["age"] for i in query] == [83.0, 46.0, 44.0]
+
+        query = database.iter_cohort_patients(
+            cohort_id, {"_id": 0, "age": 1}, chunk_size=1, include=("models",)
+        )
+        bundle = next(query)
+        assert bundle["patient"] == {"age": 83.0}
+        assert str(bundle["models"]["_id"]) == "62b445e077febb2c27a41c7d"
+        query.close()
+        query = list(database.iter_cohort_patients(cohort_id, {"_id": 0}))
+        assert [i["age"] for i in query] == [83.0, 46.0, 44.0]
+        assert not any("_id" in i for i in query)
+        query = database.iter_cohort_patients(cohort_id, {"_id": 1})
+        assert [{"_id": ObjectId(i)} for i in pat_ids] == list(query)
+        # members without a patient document are skipped
+        cohort_id = "626aba549ce90c7ccbe9510c"
+        assert not list(database.iter_cohort_patients(cohort_id))
+
+    def test_remove_patients_from_cohort(self):
+        pat850_id = "5f7f7ee40bf2b2706460424c"
+        pat843_id = str(self.db.get_patient_collection(843, "SER00005")[0]["_id"])
+        cohort_id = "626aba549ce90c7ccbe9520e"
+        self.db.add_patients_to_cohort(cohort_id, [pat843_id])
+        assert self.db.get_patient_cohort(cohort_id=cohort_id)["height"]["max"] == 180
+
+        query = self.db.remove_patients_from_cohort(cohort_id, [pat843_id, pat843_id])
+        assert query == [pat850_id]
+        cohort_doc = self.db.get_patient_cohort(cohort_id=cohort_id)
+        assert cohort_doc["patient_ids"] == [pat850_id]
+        assert cohort_doc["number_patients"] == 1
+        assert cohort_doc["height"] == {"min": 160.0, "max": 160.0}
+        assert cohort_doc["weight"] == {"min": 72.0, "max": 72.0}
+        stats = self.db.get_cohort_statistics(cohort_id)
+        assert stats["weight"]["count"] == 1 and stats["weight"]["max"] == 72.0
+        assert stats["bmi"]["mean"] == pytest.approx(24.06)
+        assert sum(i["count"] for i in stats["age"]["histogram"]) == 1
+
+    def test_remove_patient_updated_since_added(self):
+        cohort_id = "626aba549ce90c7ccbe9520e"
+        database = DBOps("local")
+        pat740_id = str(database.get_patient_collection(740)[0]["_id"])
+        database.add_patients_to_cohort(cohort_id, [pat740_id])
+        database.update_human_demographics(740, height=170, weight=70)
+
+        assert not database.remove_patients_from_cohort(cohort_id, [pat740_id])
+        stats = database.get_cohort_statistics(cohort_id)
+        for field in ("age", "height", "bmi"):
+            assert stats[field]["count"] == 0 and stats[field]["mean"] is None
+            assert not any(i["count"] for i in stats[field]["histogram"])
+        cohort_doc = database.get_patient_cohort(cohort_id=cohort_id)
+        assert cohort_doc["number_patients"] == 0
+        assert cohort_doc["height"] == {"min": None, "max": None}
+
+    @pytest.mark.parametrize("migrate", [False, True])
+    def test_remove_patient_within_bounds(self, monkeypatch, migrate):
+        cohort_id = "626aba549ce90c7ccbe9520e"
+        database = DBOps("local")
+        database.update_human_demographics(740, age=45, height=170, weight=90)
+        pat850_id, pat740_id, pat843_id = [
+            str(database.get_patient_collection(i, s)[0]["_id"])
+            for i, s in [(850, None), (740, None), (843, "SER00005")]
+        ]
+        database.add_patients_to_cohort(cohort_id, [pat850_id, pat740_id, pat843_id])
+        if migrate:
+            database.migrate_cohort_membership(cohort_id)
+
+        def rebuild(*_args, **_kwargs):
+            raise AssertionError("statistics recomputed")
+
+        with monkeypatch.context() as context:
+            context.setattr(database, "_rebuild_cohorts", rebuild)
+            assert database.remove_patients_from_cohort(cohort_id, [pat740_id]) == [
+                pat850_id,
+                pat843_id,
+            ]
+        cohort_doc = database.get_patient_cohort(cohort_id=cohort_id)
+        assert cohort_doc["number_patients"] == 2
+        assert cohort_doc["height"] == {"min": 160.0, "max": 180.0}
+        stats = database.get_cohort_statistics(cohort_id)
+        assert database.rebuild_all_cohort_stats()["cohorts"] == 2
+        rebuilt = database.get_cohort_statistics(cohort_id)
+        for field, summary in stats.items():
+            assert summary["count"] == rebuilt[field]["count"] == 2
+            assert summary["mean"] == pytest.approx(rebuilt[field]["mean"])
+            assert summary["histogram"] == rebuilt[field]["histogram"]
+
+    @pytest.mark.parametrize("migrate", [False, True])
+    def test_remove_patient_concurrent_add(self, monkeypatch, migrate):
+        cohort_id = "626aba549ce90c7ccbe9520e"
+        database = DBOps("local")
+        pat850_id, pat740_id, pat843_id = [
+            str(database.get_patient_collection(i, s)[0]["_id"])
+            for i, s in [(850, None), (740, None), (843, "SER00005")]
+        ]
+        database.add_patients_to_cohort(cohort_id, [pat850_id, pat843_id])
+        if migrate:
+            database.migrate_cohort_membership(cohort_id)
+        # pylint: disable-next=protected-access
+        rebuild_request = database._rebuild_request
+
+        def concurrent_add(doc, versions):
+            if doc["number_patients"]:
+                database.add_patients_to_cohort(cohort_id, [pat740_id])
+            return rebuild_request(doc, versions)
+
+        monkeypatch.setattr(database, "_rebuild_request", concurrent_add)
+        query = database.remove_patients_from_cohort(cohort_id, [pat843_id])
+        assert pat843_id not in query
+        # the recomputed statistics, without the added patient, are not written
+        cohort_doc = database.get_patient_cohort(cohort_id=cohort_id)
+        assert cohort_doc["number_patients"] == 2
+        assert database.get_cohort_statistics(cohort_id)["age"]["count"] == 2
+
+    def test_rebuild_all_cohort_stats(self):
+        cohort_id = "626aba549ce90c7ccbe9520e"
+        database = DBOps("local")
+        database.add_patients_to_cohort(cohort_id, ["5f7f7ee40bf2b2706460424c"])
+        stats = database.get_cohort_statistics(cohort_id)
+        database.database["patient-cohort"].update_one(
+            {"_id": ObjectId(cohort_id)},
+            {"$set": {"number_patients": 7, "height.max": 250.0, "stats": {}}},
+        )
+
+        assert database.rebuild_all_cohort_stats() == {"cohorts": 2, "modified": 2}
+        cohort_doc = database.get_patient_cohort(cohort_id=cohort_id)
+        assert cohort_doc["number_patients"] == 1
+        assert cohort_doc["height"] == {"min": 160.0, "max": 160.0}
+        assert database.get_cohort_statistics(cohort_id) == stats
+        # members without a patient document are counted but have no dimensions
+        cohort_doc = database.get_patient_cohort(cohort_id="626aba549ce90c7ccbe9510c")
+        assert cohort_doc["number_patients"] == 15
+        assert cohort_doc["weight"] == {"min": None, "max": None}
+
+    def test_migrate_cohort_membership(self):
+        cohort_id = "626aba549ce90c7ccbe9520e"
+        database = DBOps("local")
+        pat850_id, pat740_id, pat843_id = [
+            str(database.get_patient_collection(i, s)[0]["_id"])
+            for i, s in [(850, None), (740, None), (843, "SER00005")]
+        ]
+        database.add_patients_to_cohort(cohort_id, [pat850_id, pat740_id])
+        stats = database.get_cohort_statistics(cohort_id)
+        assert database.migrate_cohort_membership(cohort_id) == 1
+        assert database.migrate_cohort_membership(cohort_id) == 0
+        cohort_doc = database.database["patient-cohort"].find_one(ObjectId(cohort_id))
+        assert "patient_ids" not in cohort_doc
+        assert cohort_doc["membership"] == "collection"
+
+        cohort_doc = database.get_patient_cohort(cohort_id=cohort_id)
+        assert cohort_doc["patient_ids"] == [pat850_id, pat740_id]
+        assert cohort_doc["number_patients"] == 2
+        assert database.get_cohort_statistics(cohort_id) == stats
+        query = database.get_patient_cohort(cohort_id=cohort_id, fields=["height"])
+        assert set(query) == {"_id", "height"}
+
+        query = database.add_patients_to_cohort(cohort_id, [pat843_id, pat850_id])
+        assert query == [pat850_id, pat740_id, pat843_id]
+        cohort_doc = database.get_patient_cohort(cohort_id=cohort_id)
+        assert cohort_doc["number_patients"] == 3
+        assert cohort_doc["height"]["max"] == 180.0
+        assert database.get_cohort_statistics(cohort_id)["age"]["count"] == 3
+        query = database.get_cohorts_for_patients([pat843_id], fields=["cohort_name"])
+        assert [i["cohort_name"] for i in query[pat843_id]] == [
+            "Pulsify ES/ED Patients"
+        ]
+        fields = {"_id": 0, "cohort_name": 1}
+        query = database.get_cohorts_for_patients([pat843_id], fields=fields)
+        assert query[pat843_id] == [{"cohort_name": "Pulsify ES/ED Patients"}]
+        fields = {"_id": 0, "patient_ids": 1}
+        query = database.get_patient_cohort(cohort_id=cohort_id, fields=fields)
+        assert query == {"patient_ids": [pat850_id, pat740_id, pat843_id]}
+        query = database.iter_cohort_patients(cohort_id, ["age"], chunk_size=2)
+        assert [i["age"] for i in query] == [46.0, 83.0, 44.0]
+
+        query = database.remove_patients_from_cohort(cohort_id, [pat843_id, pat843_id])
+        assert query == [pat850_id, pat740_id]
+        cohort_doc = database.get_patient_cohort(cohort_id=cohort_id)
+        assert cohort_doc["number_patients"] == 2
+        assert cohort_doc["height"] == {"min": 160.0, "max": 160.0}
+        assert not database.get_cohorts_for_patient(pat843_id)
+        assert database.rebuild_all_cohort_stats()["cohorts"] == 2
+        assert database.get_cohort_statistics(cohort_id) == stats
+        database.database["patient-cohort"].update_one(
+            {"_id": ObjectId(cohort_id)}, {"$set": {"weight.max": 250.0}}
+        )
+        cohort_doc = database.set_max_min_patient_dimensions_in_cohort(cohort_id)
+        assert cohort_doc["weight"] == {"min": 72.0, "max": 72.0}
+
+    def test_remove_members_stale_claim(self):
+        cohort_id = "626aba549ce90c7ccbe9520e"
+        database = DBOps("local")
+        pat850_id, pat740_id = [
+            str(database.get_patient_collection(i)[0]["_id"]) for i in (850, 740)
+        ]
+        database.add_patients_to_cohort(cohort_id, [pat850_id, pat740_id])
+        database.migrate_cohort_membership(cohort_id)
+        membership = database.database["patient-cohort-membership"]
+        stale = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+        for patient_id, token in [
+            (pat850_id, ObjectId.from_datetime(stale)),
+            (pat740_id, ObjectId()),
+        ]:
+            membership.update_one(
+                {"patient_id": patient_id}, {"$set": {"removing": token}}
+            )
+
+        query = database.remove_patients_from_cohort(cohort_id, [pat850_id, pat740_id])
+        assert query == [pat740_id]
+        assert database.get_patient_cohort(cohort_id=cohort_id)["number_patients"] == 1
+
+    def test_cohort_set_operations(self, monkeypatch):
+        ed_id, es_id = "626aba549ce90c7ccbe9510c", "626aba549ce90c7ccbe9520e"
+        database = DBOps("local")
+        ed_ids = database.get_patient_cohort(cohort_id=ed_id)["patient_ids"]
+        pat_ids = [
+            str(database.get_patient_collection(i, None)[0]["_id"]) for i in (850, 740)
+        ]
+        database.add_patients_to_cohort(es_id, pat_ids + ed_ids[:1])
+
+        assert len(set(database.cohort_union([ed_id, es_id]))) == 17
+        assert database.cohort_intersection([ed_id, es_id]) == ed_ids[:1]
+        assert set(database.cohort_difference(ed_id, [es_id])) == set(ed_ids[1:])
+        cohort_doc = database.cohort_difference(es_id, [ed_id], cohort_name="ES")
+        assert set(cohort_doc["patient_ids"]) == set(pat_ids)
+        assert cohort_doc["number_patients"] == 2
+        assert cohort_doc["height"] == {"min": 160.0, "max": 160.0}
+        assert cohort_doc["derived_from"] == {
+            "operation": "difference",
+            "cohort_ids": [es_id, ed_id],
+        }
+        assert database.get_cohort_statistics(cohort_doc["_id"])["age"]["count"] == 2
+        assert not database.cohort_difference(ed_id, [ed_id])
+        cohort_doc = database.cohort_difference(ed_id, [es_id, ed_id], "None")
+        assert cohort_doc["number_patients"] == 0
+        assert cohort_doc["derived_from"]["cohort_ids"] == [ed_id, es_id, ed_id]
+
+        # mixed and membership collection layouts
+        database.migrate_cohort_membership(ed_id)
+        assert database.cohort_intersection([ed_id, es_id]) == ed_ids[:1]
+        assert not database.cohort_difference(ed_id, [es_id, ed_id])
+        database.migrate_cohort_membership(es_id)
+        assert database.cohort_difference(es_id, [ed_id]) == pat_ids
+        assert not database.cohort_difference(es_id, [ed_id, es_id])
+        monkeypatch.setattr("main.database_ops.EMBEDDED_MEMBERS_LIMIT", 1)
+        cohort_doc = database.cohort_union([es_id, ed_id], cohort_name="All")
+        assert cohort_doc["membership"] == "collection"
+        assert cohort_doc["number_patients"] == 17
+        assert cohort_doc["weight"] == {"min": 72.0, "max": 72.0}
 
     @pytest.mark.parametrize("series", ["SER00005", ["SER00005", "SER00009"]])
     def test_update_human_demographics(self, series):
@@ -110,6 +528,91 @@ class TestDBOps:
             and query[0]["weight"] == 93.0
             and query[0]["origin_location"] == "north_south_america"
         )
+        assert query[0]["bmi"] == 23.25 and query[0]["bsa"] == 2.27
+
+    def test_update_human_demographics_single_update(self):
+        database = DBOps("local")
+        with pytest.raises(ValueError):
+            database.update_human_demographics(850, age=50, weight="heavy")
+        with pytest.raises(ValueError):
+            database.update_human_demographics(850, age=50, location="europe")
+        assert database.get_patient_collection(850)[0]["age"] == 46
+        database.update_human_demographics(850, weight=64.0)
+        query = database.get_patient_collection(850)[0]
+        assert query["bmi"] == 25.0 and query["bsa"] == 1.69
+        database.update_human_demographics(740, height=170)
+        query = database.get_patient_collection(740)[0]
+        assert query["height"] == 170 and query.get("bmi") is None
+
+    def test_update_demographics_bulk(self, tmp_path):
+        database = DBOps("local")
+        cohort_id = "626aba549ce90c7ccbe9520e"
+        database.add_patients_to_cohort(cohort_id, ["5f7f7ee40bf2b2706460424c"])
+        csv_file = tmp_path / "demographics.csv"
+        csv_file.write_text(
+            "internal_id,age,gender,weight,loc\n"
+            "850,,,64,europe\n"
+            "843,200,,,\n"
+            "999,30,,,\n"
+            "663,,,,\n"
+            ",40,female,,\n"
+        )
+        query = database.update_demographics_bulk(
+            str(csv_file), chunk_size=2, refresh_cohorts=True
+        )
+        assert [row["status"] for row in query["rows"]] == [
+            "updated",
+            "invalid",
+            "not_found",
+            "unchanged",
+            "invalid",
+        ]
+        assert query["cohorts"] == 1
+        patient = database.get_patient_collection(850)[0]
+        assert patient["weight"] == 64 and patient["bmi"] == 25.0
+        assert patient["origin_location"] == "europe"
+        assert database.get_patient_collection(843, "SER00005")[0]["age"] == 44
+        cohort = database.get_patient_cohort(cohort_id=cohort_id)
+        assert cohort["weight"] == {"min": 64, "max": 64}
+        assert database.get_cohort_statistics(cohort_id)["bmi"]["mean"] == 25.0
+
+        query = database.update_demographics_bulk([{"internal_id": 843, "age": 45}])
+        assert query == {
+            "rows": [{"row": 0, "internal_id": 843, "status": "updated"}],
+            "cohorts": 0,
+        }
+        assert database.get_patient_collection(843, "SER00005")[0]["age"] == 45
+
+    def test_backfill_bmi_bsa(self):
+        database = DBOps("local", cache_size=16)
+        assert database.get_patient_collection(850)[0]["bmi"] == 24.06
+        query = database.backfill_bmi_bsa(batch_size=2, dry_run=True)
+        assert query["scanned"] == 5 and query["modified"] == 1
+        assert database.get_patient_collection(850)[0]["bmi"] == 24.06
+        database.database.patient.update_one(
+            {"internal_info.internal_id": 740},
+            {"$set": {"height": "tall", "weight": 70}},
+        )
+        database.database.patient.update_one(
+            {"internal_info.internal_id": 663}, {"$set": {"height": 0, "weight": 70}}
+        )
+        query = database.backfill_bmi_bsa(batch_size=2)
+        assert query["modified"] == 1 and query["skipped"] == 2
+        patient = database.database.patient.find_one({"internal_info.internal_id": 663})
+        assert patient["bmi"] is None and patient["bsa"] is None
+        assert query["per_second"] > 0
+        patient = database.get_patient_collection(850)[0]
+        assert patient["bmi"] == 28.12 and patient["bsa"] == 1.79
+        assert database.backfill_bmi_bsa()["modified"] == 0
+        # a batch read before a demographics update does not overwrite it
+        stale = database.database.patient.find_one({"internal_info.internal_id": 850})
+        database.update_human_demographics(850, weight=64.0)
+        stale["bmi"] = None
+        report = {"scanned": 0, "modified": 0, "skipped": 0}
+        # pylint: disable-next=protected-access
+        database._backfill_batch([stale], report, False)
+        assert report["modified"] == 0
+        assert database.get_patient_collection(850)[0]["bmi"] == 25.0
 
     @pytest.mark.parametrize("series", ["SER00302", None])
     def test_get_patient_model_list(self, capsys, series):
@@ -303,7 +806,7 @@ class TestDBOps:
         series_3 = "SER00004"
         cohort_id = "626aba549ce90c7ccbe9520e"
 
-        database = DBOps("inmemory")
+        database = DBOps("local")
         database.upload_patients_add_to_cohort(
             self.jsondir, cohort_id, patients_list=[{human_id_1: series_1}]
         )
@@ -332,3 +835,10 @@ class TestDBOps:
         assert (
             cohort_doc["weight"]["min"] == 44.0 and cohort_doc["weight"]["max"] == 88.0
         )
+
+        # stale bounds are recomputed from the members
+        database.database["patient-cohort"].update_one(
+            {"_id": ObjectId(cohort_id)}, {"$set": {"height.max": 250.0}}
+        )
+        cohort_doc = database.set_max_min_patient_dimensions_in_cohort(cohort_id)
+        assert cohort_doc["height"]["max"] == 187.0
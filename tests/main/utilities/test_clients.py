@@ -0,0 +1,100 @@
+"""
+Test units for the MongoDB clients registry.
+"""
+# pylint: disable=missing-function-docstring
+import os
+import types
+import pytest
+from main.database_ops import DBOps
+from main.utilities import clients
+
+CONFIG = {
+    "cosmosdb": {
+        "dev2": {
+            "conn_str": "mongodb://dev.example.com",
+            "max_pool_size": 20,
+            "max_idle_time_ms": 120000,
+            "connect_timeout_ms": None,
+        },
+        "dep": {
+            "conn_str": "mongodb://deploy.example.com",
+            "max_pool_size": 100,
+            "min_pool_size": 10,
+            "connect_timeout_ms": 20000,
+        },
+    },
+    "database": "testdb",
+    "collections": [],
+}
+
+
+class FakeClient:
+    """MongoClient recording its arguments instead of connecting."""
+
+    instances = []
+
+    def __init__(self, conn_str: str, **options) -> None:
+        self.conn_str = conn_str
+        self.options = options
+        self.closed = False
+        self.instances.append(self)
+
+    def __getitem__(self, name: str) -> types.SimpleNamespace:
+        return types.SimpleNamespace(client=self, name=name)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture(name="fake_clients")
+def fixture_fake_clients(monkeypatch):
+    monkeypatch.setattr(clients.pymongo, "MongoClient", FakeClient)
+    monkeypatch.setattr("main.database_ops.load_config", lambda: CONFIG)
+    monkeypatch.setattr(FakeClient, "instances", [])
+    clients.close_all()
+    yield FakeClient.instances
+    clients.close_all()
+
+
+class TestClients:
+    """Test class for clients file."""
+
+    def test_shared_client(self, fake_clients):
+        dev = [DBOps("dev").database for _ in range(2)]
+        deploy = [DBOps("deploy").database for _ in range(2)]
+        assert dev[0].client is dev[1].client
+        assert deploy[0].client is deploy[1].client
+        assert dev[0].client is not deploy[0].client
+        assert [i.conn_str for i in fake_clients] == [
+            "mongodb://dev.example.com",
+            "mongodb://deploy.example.com",
+        ]
+        assert dev[0].name == deploy[0].name == "testdb"
+
+    def test_client_options(self, fake_clients):
+        for name in ("dev", "deploy"):
+            assert DBOps(name).database.client is fake_clients[-1]
+        assert [i.options for i in fake_clients] == [
+            {"maxPoolSize": 20, "maxIdleTimeMS": 120000},
+            {"maxPoolSize": 100, "minPoolSize": 10, "connectTimeoutMS": 20000},
+        ]
+
+    def test_fork_reset(self, fake_clients, monkeypatch):
+        parent = clients.get_client(CONFIG["cosmosdb"]["dev2"])
+        child_pid = os.getpid() + 1
+        monkeypatch.setattr(clients.os, "getpid", lambda: child_pid)
+        child = clients.get_client(CONFIG["cosmosdb"]["dev2"])
+        assert child is not parent
+        assert not parent.closed
+        assert clients.get_client(CONFIG["cosmosdb"]["dev2"]) is child
+        assert len(fake_clients) == 2
+
+    def test_close_all(self, fake_clients):
+        dev = clients.get_client(CONFIG["cosmosdb"]["dev2"])
+        deploy = clients.get_client(CONFIG["cosmosdb"]["dep"])
+        clients.close_all()
+        assert dev.closed and deploy.closed
+        # pylint: disable-next=protected-access
+        assert not clients._clients
+        assert clients.get_client(CONFIG["cosmosdb"]["dev2"]) is not dev
+        assert len(fake_clients) == 3
@@ -0,0 +1,126 @@
+"""
+Test units for the pure-Python local database backend.
+"""
+# pylint: disable=missing-function-docstring
+from bson import ObjectId
+import pytest
+from pymongo import InsertOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+from main.utilities.local_db import LocalClient, seeded_database
+
+
+class TestLocalDB:
+    """Test class for local_db file."""
+
+    collection = LocalClient().testdb.patient
+    collection.insert_many(
+        [
+            {"internal_info": {"internal_id": 1, "series": "SER00001"}, "age": 40},
+            {"internal_info": {"internal_id": 2, "series": ["S1", "S2"]}, "age": 50},
+            {"internal_info": {"internal_id": 3, "series": "SER00003"}, "tags": []},
+        ]
+    )
+    collection.create_index("internal_info.internal_id")
+
+    def test_find_subdocument_and_dotted(self):
+        query = self.collection.find_one(
+            {"internal_info": {"internal_id": 1, "series": "SER00001"}}
+        )
+        assert query["age"] == 40
+        assert (
+            self.collection.find_one(
+                {"internal_info": {"series": "SER00001", "internal_id": 1}}
+            )
+            is None
+        )
+        query = list(self.collection.find({"internal_info.series": "S2"}))
+        assert [i["age"] for i in query] == [50]
+        query = list(
+            self.collection.find({"internal_info.internal_id": {"$in": [3, 1]}})
+        )
+        assert [i["internal_info"]["internal_id"] for i in query] == [1, 3]
+
+    def test_projection(self):
+        query = self.collection.find_one(
+            {"internal_info.internal_id": 2}, {"internal_info.series"}
+        )
+        assert list(query) == ["_id", "internal_info"]
+        assert query["internal_info"] == {"series": ["S1", "S2"]}
+        query = self.collection.find_one({"age": 40}, {"_id": 0, "internal_info": 0})
+        assert query == {"age": 40}
+        query = self.collection.find_one({"age": 40}, {})
+        assert list(query) == ["_id"]
+        assert list(self.collection.find_one({"age": 40}, [])) == ["_id"]
+
+    def test_update(self):
+        self.collection.update_one(
+            {"internal_info.internal_id": 3},
+            {"$addToSet": {"tags": {"$each": ["a", "b", "a"]}}},
+        )
+        query = self.collection.find_one_and_update(
+            {"internal_info.internal_id": 3},
+            {"$set": {"tags.0": "c", "height": 180}},
+            return_document=ReturnDocument.AFTER,
+        )
+        assert query["tags"] == ["c", "b"] and query["height"] == 180
+        result = self.collection.update_many({"age": {"$gte": 40}}, {"$set": {"x": 1}})
+        assert result.matched_count == 2
+        assert self.collection.count_documents({"x": 1}) == 2
+
+    def test_pipeline_update(self):
+        query = self.collection.find_one_and_update(
+            {"internal_info.internal_id": 2},
+            [
+                {"$set": {"scores": {"$concatArrays": [[1, 2], [3]]}}},
+                {"$set": {"n_scores": {"$size": "$scores"}}},
+            ],
+            return_document=ReturnDocument.AFTER,
+        )
+        assert query["scores"] == [1, 2, 3] and query["n_scores"] == 3
+        assert query["age"] == 50
+
+    def test_bulk_write(self):
+        collection = LocalClient().testdb.bulk
+        result = collection.bulk_write(
+            [
+                InsertOne({"_id": 1, "n": 0}),
+                InsertOne({"_id": 2, "n": 0}),
+                UpdateOne({"_id": 1}, {"$inc": {"n": 1}}),
+                UpdateMany({}, {"$set": {"m": True}}),
+                UpdateOne({"_id": 3}, {"$set": {"n": 3}}, upsert=True),
+            ]
+        )
+        assert result.inserted_count == 2 and result.upserted_ids == {4: 3}
+        assert result.matched_count == 3 and result.modified_count == 3
+        with pytest.raises(BulkWriteError) as error:
+            collection.bulk_write(
+                [InsertOne({"_id": 1}), UpdateOne({"_id": 2}, {"$inc": {"n": 1}})],
+                ordered=False,
+            )
+        assert error.value.details["writeErrors"][0]["index"] == 0
+        assert error.value.details["nModified"] == 1
+
+    def test_insert_many_and_delete(self):
+        collection = LocalClient().testdb.delete
+        collection.insert_many([{"_id": i, "even": i % 2 == 0} for i in range(4)])
+        with pytest.raises(BulkWriteError) as error:
+            collection.insert_many([{"_id": 1}, {"_id": 4}], ordered=False)
+        assert error.value.details["nInserted"] == 1
+        assert collection.delete_many({"even": True}).deleted_count == 2
+        assert collection.delete_one({}).deleted_count == 1
+        assert [i["_id"] for i in collection.find()] == [3, 4]
+
+    def test_returned_documents_are_copies(self):
+        query = self.collection.find_one({"internal_info.internal_id": 1})
+        query["age"] = 0
+        assert self.collection.find_one({"_id": query["_id"]})["age"] == 40
+
+    def test_seeded_database(self):
+        database = seeded_database(["patient", "models", "patient-cohort"])
+        other = seeded_database(["patient", "models", "patient-cohort"])
+        cohort_id = ObjectId("626aba549ce90c7ccbe9520e")
+        database["patient-cohort"].update_one(
+            {"_id": cohort_id}, {"$set": {"number_patients": 5}}
+        )
+        assert other["patient-cohort"].find_one(cohort_id)["number_patients"] == 0
+        assert database.patient.count_documents({}) == 5
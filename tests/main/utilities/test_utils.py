@@ -0,0 +1,116 @@
+"""
+Test units for the database operations utilities.
+"""
+# pylint: disable=missing-function-docstring
+import math
+import os
+import random
+from bson import ObjectId
+import numpy
+import pytest
+from main.database_ops import DBOps
+from main.utilities import utils
+from main.utilities.utils import (
+    calculate_bmi,
+    calculate_mosteller_bsa,
+    load_config,
+    load_seed_documents,
+)
+
+
+def as_list(values) -> list:
+    return [None if math.isnan(v) else float(v) for v in values]
+
+
+class TestUtils:
+    """Test class for utils file."""
+
+    def test_load_seed_documents(self, tmp_path):
+        json_file = tmp_path / "test_patient.json"
+        json_file.write_text(
+            '[{"_id": {"$oid": "5f7f7ee40bf2b2706460424c"}, "age": 46.0, "height": 160},'
+            ' {"internal_info": {"internal_id": 850, "series": "SER00002"}}]',
+            encoding="utf-8",
+        )
+        snapshot = tmp_path / "test_patient.snapshot.bson"
+
+        documents = load_seed_documents(str(json_file))
+        assert documents[0] == {
+            "_id": ObjectId("5f7f7ee40bf2b2706460424c"),
+            "age": 46.0,
+            "height": 160,
+        }
+        assert isinstance(documents[0]["height"], int)
+        assert os.path.exists(snapshot)
+        assert load_seed_documents(str(json_file)) == documents
+
+        json_file.write_text('{"age": 83}', encoding="utf-8")
+        assert load_seed_documents(str(json_file)) == [{"age": 83}]
+
+    def test_load_config(self, tmp_path, monkeypatch):
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("database: first\n", encoding="utf-8")
+        parsed = []
+
+        def full_load(stream):
+            parsed.append(stream.name)
+            return {"database": stream.read().split()[1]}
+
+        monkeypatch.setattr(utils.yaml, "full_load", full_load)
+        config = load_config(str(config_file))
+        assert config == {"database": "first"}
+        assert load_config(str(config_file)) is config
+        assert parsed == [str(config_file)]
+
+        config_file.write_text("database: second\n", encoding="utf-8")
+        mtime = os.stat(config_file).st_mtime_ns + 1000000000
+        os.utime(config_file, ns=(mtime, mtime))
+        assert load_config(str(config_file)) == {"database": "second"}
+        assert len(parsed) == 2
+
+    def test_database_connected_on_first_use(self, monkeypatch):
+        connect = DBOps._connect  # pylint: disable=protected-access
+        calls = []
+
+        def counted_connect(database):
+            calls.append(database.db_name)
+            return connect(database)
+
+        monkeypatch.setattr(DBOps, "_connect", counted_connect)
+        database = DBOps("local")
+        assert not calls
+        assert database.database is database.database
+        assert database.database.patient.count_documents({}) > 0
+        assert calls == ["local"]
+
+    def test_body_indices_arrays(self):
+        weights = [72, None, float("nan"), 108.0, 70]
+        heights = [160, 170, 170, 180.0, 0]
+        assert as_list(calculate_bmi(weights, heights)) == [
+            28.12,
+            None,
+            None,
+            33.33,
+            None,
+        ]
+        assert as_list(calculate_mosteller_bsa(weights, 160)) == [
+            1.79,
+            None,
+            None,
+            2.19,
+            1.76,
+        ]
+        query = calculate_bmi(numpy.array([72, numpy.nan]), 160.0)
+        assert isinstance(query, numpy.ndarray) and query.dtype == float
+        with pytest.raises(ValueError):
+            calculate_bmi(weights, heights[:2])
+        with pytest.raises(ValueError):
+            calculate_mosteller_bsa(weights[:1], heights)
+
+        rng = random.Random(0)
+        weights = [round(rng.uniform(1, 200), rng.randint(0, 3)) for _ in range(5000)]
+        heights = [round(rng.uniform(40, 220), rng.randint(0, 2)) for _ in range(5000)]
+        for function in (calculate_bmi, calculate_mosteller_bsa):
+            assert as_list(function(weights, heights)) == [
+                function(w, h) for w, h in zip(weights, heights)
+            ]